@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Benchmark helper for development: impose synthetic PDF files and report
+throughput, per-stage times, peak memory and output size (inputs are generated
+with fpdf, no longer a runtime dependency : pip install hackimposition[bench]).
+
+    bin/bench.py                                 # default cases
+    bin/bench.py --pages 16 256 4096 --kinds text vector
+    bin/bench.py --save-baseline bench.json      # store the results
+    bin/bench.py --baseline bench.json           # compare, exit 1 on regression
+    bin/bench.py --backends pypdf2 pikepdf       # compare backends, exit 1 if
+                                                 # their outputs do not match
+"""
+
+import argparse
+from hashlib import sha1
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from fpdf import FPDF
+import PyPDF2
+import hackimposition
+from hackimposition.backends import NAMES as BACKENDS
+from hackimposition.profiling import Profiler
+
+PAGE_SIZES = {"a5": (420.9, 595.3), "a4": (595.3, 841.9), "a6": (297.6, 420.9)}
+KINDS = ("text", "vector", "image")
+
+
+def _png(filename, size=256):
+    """ PNG RGB synthétique, sans dépendance """
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data +
+                struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+    raw = b"".join(b"\0" + bytes((x * 7 + y * 3) % 256 for x in range(size)
+                                 for _ in range(3)) for y in range(size))
+    with open(filename, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)))
+        file.write(chunk(b"IDAT", zlib.compress(raw)))
+        file.write(chunk(b"IEND", b""))
+
+
+def make_pdf(filename, nb_pages, kind="text", page_size="a5", workdir=None):
+    """ Génère un PDF synthétique de nb_pages pages """
+    width, height = PAGE_SIZES[page_size]
+    pdf = FPDF('P', 'pt', (width, height))
+    pdf.set_font('Helvetica', size=11)
+    image = None
+    if kind == "image":
+        image = os.path.join(workdir or tempfile.gettempdir(), "bench.png")
+        _png(image)
+    for page in range(nb_pages):
+        pdf.add_page()
+        pdf.set_font_size(48)
+        pdf.text(40, 80, f"Page {page + 1}")
+        if kind == "text":
+            pdf.set_font_size(9)
+            for line in range(int((height - 140) // 11)):
+                pdf.text(40, 120 + 11 * line,
+                         f"{page}.{line} Lorem ipsum dolor sit amet, "
+                         "consectetur adipiscing elit, sed do eiusmod.")
+        elif kind == "vector":
+            for i in range(200):
+                pdf.set_draw_color(i % 255, (7 * i) % 255, (13 * i) % 255)
+                pdf.line(20 + (i * 37) % (width - 40), 100,
+                         20 + (i * 53) % (width - 40), height - 20)
+                pdf.ellipse(30 + (i * 11) % (width - 80),
+                            110 + (i * 17) % (height - 160), 20, 20)
+        else:
+            pdf.image(image, 20, 100, width - 40, width - 40)
+    pdf.output(filename, 'F')
+
+
+def _run(infile, outfile, stream, trace_memory, backend=None):
+    # pylint: disable=too-many-arguments
+    template = hackimposition.ImposerPageTemplate()
+    imposer = hackimposition.ImposerAlgo(template.nb_w, template.nb_h)
+    with Profiler(trace_memory=trace_memory) as profiler:
+        start = time.perf_counter()
+        hackimposition.impose(template, imposer, infile, outfile,
+                              stream=stream, profiler=profiler,
+                              backend=backend)
+    return time.perf_counter() - start, profiler
+
+
+_PLACEMENT = re.compile(rb"q ([-\d. ]+) cm (/HIPage\d+) Do Q")
+
+
+def placements(filename):
+    """
+    Résultat visible d'une imposition : par feuille, taille et (page, matrice,
+    BBox, empreinte du contenu décodé) de chaque page placée
+    """
+    pdf = PyPDF2.PdfFileReader(filename)
+    sheets = []
+    for page in pdf.pages:
+        xobjects = page["/Resources"]["/XObject"]
+        placed = []
+        for ctm, name in _PLACEMENT.findall(page.getContents().getData()):
+            form = xobjects[name.decode()].getObject()
+            placed.append((name.decode(),
+                           tuple(round(float(val), 3) for val in ctm.split()),
+                           tuple(round(float(val), 3) for val in form["/BBox"]),
+                           sha1(form.getData()).hexdigest()))
+        sheets.append((tuple(round(float(val), 3) for val in page.mediaBox),
+                       placed))
+    return sheets
+
+
+def bench_case(workdir, nb_pages, kind, page_size, stream, repeat,
+               backend=None):
+    # pylint: disable=too-many-arguments
+    """ Mesure un cas : meilleur temps sur repeat exécutions + mémoire """
+    infile = os.path.join(workdir, f"in-{kind}-{page_size}-{nb_pages}.pdf")
+    outfile = os.path.join(workdir, f"out-{backend or BACKENDS[0]}.pdf")
+    if not os.path.exists(infile):
+        make_pdf(infile, nb_pages, kind, page_size, workdir)
+
+    best, stages = None, None
+    for _ in range(repeat):
+        seconds, profiler = _run(infile, outfile, stream, False, backend)
+        if best is None or seconds < best:
+            best = seconds
+            stages = {stage["name"]: stage["wall_s"]
+                      for stage in profiler.stages}
+    _, profiler = _run(infile, outfile, stream, True, backend)
+
+    case = f"{kind}/{page_size}/{nb_pages}/{'stream' if stream else 'serial'}"
+    if backend not in (None, BACKENDS[0]):
+        case += f"/{backend}"
+    return {
+        "case": case,
+        "outfile": outfile,
+        "pages": nb_pages,
+        "seconds": best,
+        "pages_per_s": nb_pages / best,
+        "stages": stages,
+        "peak_alloc_bytes": max(stage["peak_alloc_bytes"]
+                                for stage in profiler.stages),
+        "input_bytes": os.path.getsize(infile),
+        "output_bytes": os.path.getsize(outfile),
+    }
+
+
+def compare(results, baseline, threshold):
+    """ Régressions par rapport à baseline (liste de messages) """
+    reference = {result["case"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        ref = reference.get(result["case"])
+        if ref is None:
+            continue
+        checks = (("pages_per_s", ref["pages_per_s"] / result["pages_per_s"]),
+                  ("peak_alloc_bytes", result["peak_alloc_bytes"] / ref["peak_alloc_bytes"]),
+                  ("output_bytes", result["output_bytes"] / ref["output_bytes"]))
+        for name, ratio in checks:
+            if ratio > 1 + threshold:
+                regressions.append(f"{result['case']}: {name} "
+                                   f"{(ratio - 1) * 100:+.0f}% worse")
+    return regressions
+
+
+def main():
+    """ benchmark """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[16, 128, 1024])
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", nargs="+", choices=PAGE_SIZES, default=["a5"])
+    parser.add_argument("--stream", action="store_true", help="also bench --stream")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS,
+                        default=[BACKENDS[0]],
+                        help="backends to bench (outputs must match)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", help="keep generated inputs here")
+    parser.add_argument("--json", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="tolerated regression ratio (default 0.2)")
+    opts = parser.parse_args()
+    logging.getLogger(hackimposition.__name__).setLevel(logging.ERROR)
+
+    workdir = opts.workdir or tempfile.mkdtemp(prefix="hackimposition-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results, mismatches = [], []
+    print(f"{'case':34} {'pages/s':>9} {'s':>8} {'alloc MB':>9} "
+          f"{'in kB':>8} {'out kB':>8}")
+    for kind in opts.kinds:
+        for page_size in opts.sizes:
+            for nb_pages in opts.pages:
+                for stream in (False, True) if opts.stream else (False,):
+                    outputs = {}
+                    for backend in opts.backends:
+                        if stream and backend != BACKENDS[0]:
+                            continue    # écriture au fil de l'eau : PyPDF2
+                        result = bench_case(workdir, nb_pages, kind, page_size,
+                                            stream, opts.repeat, backend)
+                        outputs[backend] = placements(result.pop("outfile"))
+                        results.append(result)
+                        print(f"{result['case']:34} {result['pages_per_s']:9.1f} "
+                              f"{result['seconds']:8.3f} "
+                              f"{result['peak_alloc_bytes'] / 2**20:9.1f} "
+                              f"{result['input_bytes'] / 1024:8.0f} "
+                              f"{result['output_bytes'] / 1024:8.0f}")
+                    reference = outputs.pop(opts.backends[0])
+                    mismatches += [f"{kind}/{page_size}/{nb_pages}: {backend} "
+                                   f"output differs from {opts.backends[0]}"
+                                   for backend, output in outputs.items()
+                                   if output != reference]
+
+    for path in (opts.json, opts.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(results, file, indent=1)
+
+    for mismatch in mismatches:
+        print("MISMATCH", mismatch)
+    regressions = []
+    if opts.baseline:
+        with open(opts.baseline) as file:
+            regressions = compare(results, json.load(file), opts.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+    sys.exit(int(bool(regressions or mismatches)))
+
+
+if __name__ == '__main__':
+    main()
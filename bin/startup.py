@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for development: import time of the command line
+(python -X importtime -m hackimposition ARGS) against a budget. The heavy
+dependencies must not be imported before the stage that needs them.
+
+    bin/startup.py                        # --version, exit 1 over budget
+    bin/startup.py --args=--help --budget 80
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# modules que --help / --version ne doivent pas importer
+HEAVY = ("PyPDF2", "fpdf", "numpy", "colorlog", "http.server",
+         "concurrent.futures", "multiprocessing")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(args):
+    """ {module: (self_us, cumulative_us, depth)} d'un lancement """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m",
+                           "hackimposition", *args], env=env, check=False,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)),
+                                       int(match.group(2)),
+                                       len(match.group(3)) // 2)
+    return modules
+
+
+def main():
+    """ startup benchmark """
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--args", default="--version",
+                        help="command line arguments (default --version)")
+    parser.add_argument("--budget", type=float, default=100,
+                        help="total import time budget in ms (default 100)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest modules shown")
+    opts = parser.parse_args()
+
+    # meilleur des essais : le premier paye le cache disque et les .pyc
+    runs = [importtime(opts.args.split()) for _ in range(opts.repeat)]
+    totals = [sum(cumul for _, cumul, depth in run.values() if depth == 0)
+              for run in runs]
+    best = runs[totals.index(min(totals))]
+    total_ms = min(totals) / 1000
+
+    print(f"{'module':40} {'self ms':>8} {'cumul ms':>9}")
+    for name, (self_us, cumul, _) in sorted(
+            best.items(), key=lambda item: -item[1][1])[:opts.top]:
+        print(f"{name:40} {self_us / 1000:8.1f} {cumul / 1000:9.1f}")
+    print(f"total import time: {total_ms:.1f} ms (budget {opts.budget:.0f} ms)")
+
+    errors = [f"{name} imported" for name in HEAVY if name in best]
+    if total_ms > opts.budget:
+        errors.append(f"over budget by {total_ms - opts.budget:.1f} ms")
+    for error in errors:
+        print("REGRESSION", error)
+    sys.exit(int(bool(errors)))
+
+
+if __name__ == '__main__':
+    main()
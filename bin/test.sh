@@ -1,5 +1,39 @@
 #!/bin/bash
-
 # Helper file for development tests: call `hackimposition`.
+# `bin/test.sh regression`: impose blank documents whose last signature has an
+# empty verso (1, 2, 17, 18 pages) in every mode, checked by --verify fast.
 export PYTHONPATH="$(cd $(dirname $0)/.. && pwd):$PYTHONPATH"
-python -m hackimposition $*
+
+if [ "$1" != "regression" ]; then
+    python -m hackimposition $*
+    exit $?
+fi
+
+tmp=$(mktemp -d)
+trap 'rm -rf "$tmp"' EXIT
+status=0
+modes=("" "--stream" "-j 2" "--pipeline")
+if python -c "import pikepdf" 2> /dev/null; then
+    modes+=("--backend pikepdf")
+else
+    echo "skip --backend pikepdf: pikepdf is not installed"
+fi
+for n in 1 2 17 18; do
+    python -c "
+import PyPDF2
+out = PyPDF2.PdfFileWriter()
+for _ in range($n):
+    out.addBlankPage(595, 842)
+with open('$tmp/in$n.pdf', 'wb') as file:
+    out.write(file)"
+    for mode in "${modes[@]}"; do
+        if python -m hackimposition "$tmp/in$n.pdf" --outfile "$tmp/out.pdf" \
+                $mode > /dev/null 2> "$tmp/log"; then
+            echo "ok   $n pages $mode"
+        else
+            echo "FAIL $n pages $mode: $(tail -n 1 "$tmp/log")"
+            status=1
+        fi
+    done
+done
+exit $status
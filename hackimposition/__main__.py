@@ -1,23 +1,69 @@
 #!/usr/bin/env python3
 """ main """
 
+import json
 import logging
 import sys
-from colorlog import ColoredFormatter
 
 import hackimposition
-from hackimposition.options import process_args
+from hackimposition.options import (
+    process_args, process_batch_args, process_serve_args)
+
+
+class _ColoredFormatter(logging.Formatter):
+    """ colorlog.ColoredFormatter, importé au premier message """
+
+    def __init__(self, fmt):
+        super().__init__(fmt)
+        self._formatter = None
+
+    def format(self, record):
+        if self._formatter is None:
+            from colorlog import ColoredFormatter  # pylint: disable=import-outside-toplevel
+            self._formatter = ColoredFormatter(self._fmt)
+        return self._formatter.format(record)
 
 
 stream = logging.StreamHandler()
 LF = "%(log_color)s%(levelname)-8s%(reset)s | %(log_color)s%(message)s%(reset)s"
-stream.setFormatter(ColoredFormatter(LF))
+stream.setFormatter(_ColoredFormatter(LF))
 logger = logging.getLogger(hackimposition.__name__).addHandler(stream)
 
 
 def main():
     """ begin imposition """
-    hackimposition.impose(*process_args(sys.argv[1:]))
+    if sys.argv[1:2] == ["batch"]:
+        *args, options = process_batch_args(sys.argv[2:])
+        if options.pop("plan_only", False):
+            results = hackimposition.quote_many(*args, file=sys.stdout,
+                                                **options)
+            sys.exit(int(any("error" in result for result in results)))
+        results = hackimposition.impose_many(*args, **options)
+        sys.exit(int(any(error for *_, error in results)))
+
+    if sys.argv[1:2] == ["serve"]:
+        from hackimposition.server import serve  # pylint: disable=import-outside-toplevel
+        serve(**process_serve_args(sys.argv[2:]))
+        return
+
+    *args, options = process_args(sys.argv[1:])
+    if options.pop("plan_only", False):
+        template, imposer, infile, outfile = args
+        result = json.dumps(hackimposition.quote(template, imposer, infile,
+                                                 **options))
+        if outfile and outfile != "-":
+            with open(outfile, 'w') as file:
+                file.write(result + "\n")
+        else:
+            print(result)
+        return
+    if "variants" in options:
+        # --variant : la commande de base est la première variante
+        template, imposer, infile, outfile = args
+        variants = [(template, imposer, outfile)] + options.pop("variants")
+        results = hackimposition.impose_variants(variants, infile, **options)
+        sys.exit(int(any(error for *_, error in results)))
+    hackimposition.impose(*args, **options)
 
     #    logger.debug('debug message')
     #    logger.info('info message')
@@ -0,0 +1,32 @@
+"""
+PDF backends : read the input, impose the plan, write the output
+
+    pypdf2  : PyPDF2, pure Python (default) ; the only backend that writes
+              signature by signature (--stream, --jobs, --incremental,
+              --pipeline)
+    pikepdf : qpdf through pikepdf (optional dependency), C++ parser/writer
+
+A backend has a name, a streaming flag and three methods :
+    read(filename)                                 --> (pdf, w, h, nb_pages)
+    impose(plan, nb_sheets, template, pdf, marks, *, profiler, dedup)
+                                                   --> output
+    write(output, outfile, infos, *, compress, object_streams)
+filename is a file name or a bytes-like object, outfile a file name or a
+writable binary file (see buffers).
+"""
+
+NAMES = ("pypdf2", "pikepdf")
+
+
+def get_backend(name=None):
+    """ Backend name (None : default backend) """
+    # pylint: disable=import-outside-toplevel
+    # le moteur PDF n'est importé que pour le backend choisi
+    if name in (None, "pypdf2"):
+        from hackimposition.imposition import PyPDF2Backend
+        return PyPDF2Backend()
+    if name == "pikepdf":
+        from hackimposition.pikepdf_backend import PikepdfBackend
+        return PikepdfBackend()
+    raise ValueError(f"Unknown backend {name} "
+                     f"(expected one of {', '.join(NAMES)})")
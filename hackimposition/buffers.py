@@ -0,0 +1,138 @@
+"""
+In-memory inputs and outputs of impose() : no temporary file
+
+An input is a file name, "-" (standard input), a bytes-like object (bytes,
+bytearray, memoryview, mmap), read in place, or a binary file object (mapped
+in memory when it is a regular file, else read once).
+An output is a file name, "-" (standard output), a writable binary file
+object, or None : impose() then returns the PDF as bytes.
+"""
+
+from contextlib import contextmanager
+import io
+import mmap
+import sys
+
+STDIO = "-"
+
+
+class MemoryReader(io.RawIOBase):
+    """ Fichier en lecture seule sur un objet bytes-like, sans copie """
+
+    def __init__(self, data):
+        super().__init__()
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = (0, self._pos, len(self._view))[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, buffer):
+        size = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else \
+            min(len(self._view), self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+
+def is_path(obj):
+    """ obj désigne un fichier par son nom (ni "-" ni données) """
+    return isinstance(obj, str) and obj != STDIO
+
+
+def source_name(infile):
+    """ Nom de infile pour les messages et les métadonnées """
+    if is_path(infile):
+        return infile
+    if infile == STDIO:
+        return "<stdin>"
+    name = getattr(infile, "name", None)
+    return name if isinstance(name, str) else "<memory>"
+
+
+def read_source(infile):
+    """
+    infile --> nom de fichier ou objet bytes-like (lu à la demande)
+    Les fichiers ordinaires sont projetés en mémoire (mmap), les autres
+    (tubes, sockets...) lus en entier une seule fois.
+    """
+    if is_path(infile):
+        return infile
+    if infile == STDIO:
+        infile = sys.stdin.buffer
+    if not hasattr(infile, "read"):
+        return infile
+    try:
+        if infile.seekable() and infile.tell() == 0:
+            return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        pass
+    return infile.read()
+
+
+def searchable(data):
+    """ Objet bytes-like --> objet avec find() (copie d'une vue partielle) """
+    if isinstance(data, memoryview):
+        base = data.obj
+        if data.contiguous and isinstance(base, (bytes, bytearray, mmap.mmap)) \
+                and data.nbytes == len(base):
+            return base
+        return data.tobytes()
+    return data
+
+
+class _CountingWriter(io.RawIOBase):
+    """
+    Ecritures dans file, positions comptées depuis le début du PDF : les
+    tubes n'ont pas de tell(), et un fichier peut ne pas être vide
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        self.file = file
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.file.write(data)
+        size = memoryview(data).nbytes
+        self._pos += size
+        return size
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        self.file.flush()
+
+
+@contextmanager
+def writable(outfile):
+    """ Fichier binaire ouvert en écriture sur outfile (nom, "-" ou fichier) """
+    if is_path(outfile):
+        with open(outfile, 'wb') as file:
+            yield file
+    else:
+        writer = _CountingWriter(sys.stdout.buffer if outfile == STDIO
+                                 else outfile)
+        yield writer
+        writer.flush()
@@ -0,0 +1,90 @@
+"""
+Deduplication of the objects copied from the input PDF files
+
+Objects are identified by a content hash computed over their serialized form
+and, recursively, over the hash of the objects they reference : two copies of
+the same font or image get the same hash wherever they come from. Objects
+that can reach a reference cycle keep their identity.
+"""
+
+from hashlib import sha1
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+from hackimposition.writer import tokenize
+
+
+class Deduplicator:
+    """ Empreintes de contenu des objets externes et références canoniques """
+
+    def __init__(self):
+        self._digests = {}              # (pdf, gen, idnum) --> (hash, acyclique)
+        self._stack = set()
+        self._canonical = {}            # hash --> première référence vue
+
+    @staticmethod
+    def _key(ref):
+        return (id(ref.pdf), ref.generation, ref.idnum)
+
+    def _digest(self, ref):
+        key = self._key(ref)
+        if key in self._digests:
+            return self._digests[key]
+        if key in self._stack:
+            return (None, False)
+        self._stack.add(key)
+        content = sha1()
+        acyclic = True
+        for token in tokenize(ref.getObject()):
+            if isinstance(token, bytes):
+                content.update(token)
+            else:
+                digest, child_acyclic = self._digest(token)
+                acyclic &= child_acyclic
+                content.update(b" R:%s " % (digest or b""))
+        self._stack.discard(key)
+        if not acyclic:
+            content = sha1(b"id %d %d" % (ref.generation, ref.idnum))
+        self._digests[key] = (content.digest(), acyclic)
+        return self._digests[key]
+
+    def digest(self, ref):
+        """ Empreinte de l'objet référencé par ref """
+        digest, acyclic = self._digest(ref)
+        return digest if acyclic else (ref.generation, ref.idnum)
+
+    def content_digest(self, obj):
+        """
+        Empreinte d'un objet direct et des objets qu'il référence
+        None si l'un d'eux atteint un cycle (pas d'empreinte de contenu)
+        """
+        content = sha1()
+        for token in tokenize(obj):
+            if isinstance(token, bytes):
+                content.update(token)
+            else:
+                digest, acyclic = self._digest(token)
+                if not acyclic:
+                    return None
+                content.update(b" R:%s " % digest)
+        return content.digest()
+
+    def canonical(self, ref):
+        """ Première référence vue vers un objet de même contenu """
+        return self._canonical.setdefault(self.digest(ref), ref)
+
+    def rewrite(self, obj, _seen=None):
+        """
+        Remplace en place, dans obj et les objets qu'il référence, chaque
+        référence par sa référence canonique
+        """
+        seen = set() if _seen is None else _seen
+        items = obj.items() if isinstance(obj, DictionaryObject) else \
+            enumerate(obj) if isinstance(obj, ArrayObject) else ()
+        for key, value in list(items):
+            if isinstance(value, IndirectObject):
+                value = obj[key] = self.canonical(value)
+                if self._key(value) not in seen:
+                    seen.add(self._key(value))
+                    self.rewrite(value.getObject(), seen)
+            else:
+                self.rewrite(value, seen)
+        return obj
@@ -0,0 +1,118 @@
+"""
+Fold tables : order of the pages of one signature on the sheets
+
+A signature is one sheet printed on both sides (recto: sheet offset 0, verso:
+sheet offset 1) with a grid of nb_w cells x nb_h cells, each cell holding two
+pages (x in [0, 2 * nb_w[, y in [0, nb_h[). It carries 4 * nb_w * nb_h pages.
+
+A table has one line (sheet offset, x, y, rotate) per page of the signature :
+line k < half is the k-th page of the first half of the signature, line
+2 * half - 1 - k is the k-th page from the end.
+"""
+
+from functools import lru_cache
+import numpy
+
+NATURAL = "natural"
+FOLD = "fold"
+
+# Fold sequence symbols : which half of the folded sheet goes over the other
+#   '<' : left half over the right half       '>' : right half over the left
+#   '^' : bottom half over the top half       'v' : top half over the bottom
+_FOLDS = {'<': ('x', 0), '>': ('x', 1), '^': ('y', 0), 'v': ('y', 1)}
+
+
+def _is_power_of_two(val):
+    return val > 0 and val & (val - 1) == 0
+
+
+def default_folds(nb_w, nb_h):
+    """ Séquence de pliage à angle droit, le dernier pli fait le dos """
+    w, h = 2 * nb_w, nb_h
+    folds = ""
+    while w > 1 or h > 1:
+        if w > h or h == 1:
+            folds += '>' if '<' in folds else '<'
+            w //= 2
+        else:
+            folds += 'v'
+            h //= 2
+    return folds
+
+
+def _natural_table(nb_w, nb_h):
+    """
+    Ordre naturel : chaque cellule est une double page, les doubles pages
+    s'emboîtent (piqûre à cheval), rangées de haut en bas
+    """
+    half = 2 * nb_w * nb_h
+    table = [None] * (2 * half)
+    for cell in range(nb_w * nb_h):
+        c_x, c_y = cell % nb_w, nb_h - 1 - cell // nb_w
+        v_x = nb_w - 1 - c_x                  # verso : cellule en miroir
+        rotate = c_y % 2
+        table[2 * cell] = (0, 2 * c_x + 1, c_y, rotate)
+        table[2 * half - 1 - 2 * cell] = (0, 2 * c_x, c_y, rotate)
+        table[2 * cell + 1] = (1, 2 * v_x, c_y, rotate)
+        table[2 * half - 2 - 2 * cell] = (1, 2 * v_x + 1, c_y, rotate)
+    return table
+
+
+def _folded_table(nb_w, nb_h, folds):
+    """
+    Simulation du pliage de la feuille, recto contre la table
+    Chaque emplacement suit sa position dans le pli, sa couche, s'il est
+    retourné, et s'il est tête en bas (retourné autour d'un axe horizontal).
+    """
+    w, h = 2 * nb_w, nb_h
+    if not (_is_power_of_two(w) and _is_power_of_two(h)):
+        raise ValueError(f"Cannot fold a {w}x{h} sheet: not a power of two")
+    # (x, y) --> [u, v, couche, retourné, tête en bas]
+    slots = {(x, y): [x, y, 0, False, False] for x in range(w) for y in range(h)}
+    layers = 1
+    for fold in folds:
+        if fold not in _FOLDS:
+            raise ValueError(f"Unknown fold '{fold}' (expected one of <>^v)")
+        axis, moving_high = _FOLDS[fold]
+        dim = 0 if axis == 'x' else 1
+        size = w if axis == 'x' else h
+        if size == 1:
+            raise ValueError(f"Fold sequence '{folds}' folds a single cell")
+        for slot in slots.values():
+            if (slot[dim] >= size // 2) == bool(moving_high):
+                slot[dim] = size - 1 - slot[dim]
+                slot[2] = 2 * layers - 1 - slot[2]
+                slot[3] = not slot[3]
+                slot[4] ^= axis == 'y'
+            slot[dim] %= size // 2
+        w, h = (w // 2, h) if axis == 'x' else (w, h // 2)
+        layers *= 2
+    if (w, h) != (1, 1):
+        raise ValueError(f"Fold sequence '{folds}' leaves a {w}x{h} sheet")
+
+    table = []
+    for (x, y), (_, _, _, turned, upside_down) in sorted(
+            slots.items(), key=lambda item: -item[1][2]):
+        # le verso est vu en miroir une fois la feuille retournée
+        for side in (int(not turned), int(turned)):
+            table.append((side, 2 * nb_w - 1 - x if side else x, y,
+                          int(upside_down)))
+    return table
+
+
+@lru_cache(maxsize=None)
+def fold_table(nb_w, nb_h, method=None):
+    """
+    Fold table of a nb_w x nb_h grid (memoized, read-only numpy array)
+    method: None or "natural", "fold" (default fold sequence of the grid) or
+    a fold sequence such as "<v>"
+    """
+    method = method if method else NATURAL
+    if method == NATURAL:
+        table = _natural_table(nb_w, nb_h)
+    else:
+        folds = default_folds(nb_w, nb_h) if method == FOLD else method
+        table = _folded_table(nb_w, nb_h, folds)
+    table = numpy.array(table, dtype=numpy.int64)
+    table.flags.writeable = False
+    return table
@@ -0,0 +1,1253 @@
+"""
+Imposition : template geometry, page order, placement plan and PDF writing
+"""
+
+from collections import OrderedDict
+import copy
+from hashlib import sha1
+import io
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+import zlib
+import numpy                    # placement plan
+import PyPDF2                   # generic usage
+from PyPDF2.generic import (    # Form XObject
+    DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject,
+    NameObject, RectangleObject)
+from hackimposition import __PRGM__, __VERSION__, __COPYRIGHT__
+from hackimposition.backends import get_backend
+from hackimposition.buffers import (
+    MemoryReader, is_path, read_source, source_name, writable)
+from hackimposition.dedup import Deduplicator
+from hackimposition.fold import fold_table
+from hackimposition.marks import template_marks
+from hackimposition.pipeline import (
+    BackgroundWriter, SharedReader, prefetch)
+from hackimposition.profiling import NULL_PROFILER, Profiler
+from hackimposition.verify import verify as _verify
+from hackimposition.writer import FragmentWriter, StreamingPdfWriter
+
+_TEMPLATE_XOBJECT = "/HITemplate"
+_PAGE_XOBJECT = "/HIPage{}"
+
+# Plan de placement : une ligne par page d'entrée
+PLAN_DTYPE = numpy.dtype([("index", numpy.int64), ("sheet", numpy.int32),
+                          ("x", numpy.int16), ("y", numpy.int16),
+                          ("rotate", numpy.int8),
+                          ("matrix", numpy.float64, (6,))])
+logger = logging.getLogger(__name__)
+
+
+def mmtopt(val_mm):
+    """ mm to pt """
+    return 2.834645669 * val_mm
+
+
+# pylint: disable=too-many-instance-attributes
+class ImposerPageTemplate:
+    """
+    Definition de la géometrie
+    """
+
+    def __init__(self):
+        self.unit = 'pt'                     # self.unit # A3 https://papersizes.io/a/a3
+        self.global_w = 1190.7               # Largeur du fichier de sortie
+        self.global_h = 842.0                # Hauteur du fichier de sortie
+
+        self.int_margin = mmtopt(5)          # Marge interne
+        self.ext_margin = mmtopt(3)          # Marge externe
+        self.nb_w = 2                        # Nombre de feuille en largeur
+        self.nb_h = 2                        # Nombre de feuille en hauteur
+
+        self.dec_margin = mmtopt(5)          # Marge pour les traits de découpe
+        self.dec_line_coef = 0.8             # Espace occupé dans la zone
+        self.dec_color = (0, 0, 0)           # Couleur des traits de découpe
+        self.dec_keep_overflow = True        # Conservation du surplus de marge
+
+        self.display_debug = False           # Dessine le patron dans le template
+
+        self.scale = None
+
+        self.data_w = None
+        self.data_h = None
+
+        # place disponible en plus par cellule
+        self.delta_marj_w = None
+        self.delta_marj_h = None
+
+        # Marge des cellules
+        self.x_margin = None
+        self.y_margin = None
+
+        # Taille des cellules
+        self.x_size = None
+        self.y_size = None
+
+
+    def compute_internals(self, ini_w, ini_h, warn=True):
+        """ Compute internals (warn: log the scale when it is not 1) """
+        # Total Dec Margin
+        tdmw = self.dec_margin * (self.nb_w + 1)
+        tdmh = self.dec_margin * (self.nb_h + 1)
+
+        # Total Ext Largin
+        temw = self.ext_margin * 2
+        temh = self.ext_margin * 2
+
+        # Total Cell Space max
+        tcswmax = self.global_w - tdmw - temw
+        tcshmax = self.global_h - tdmh - temh
+
+        final_wmax = tcswmax / self.nb_w  # W cell max
+        final_hmax = tcshmax / self.nb_h  # H cell max
+
+        scale_w = (final_wmax - 2. * self.int_margin) / (ini_w * 2)
+        scale_h = (final_hmax - 2. * self.int_margin) / ini_h
+        self.scale = min(scale_w, scale_h)  # scale IMG (maximisation)
+
+        self.data_w = float(ini_w * 2) * self.scale
+        self.data_h = float(ini_h) * self.scale
+
+        final_w = self.data_w + self.int_margin * 2      # W cell final
+        final_h = self.data_h + self.int_margin * 2       # H cell final
+
+        tcsw = final_w * self.nb_w
+        tcsh = final_h * self.nb_h
+
+        # Total delta margin
+        tdltmw = self.global_w - tcsw - temw - tdmw
+        tdltmh = self.global_h - tcsh - temh - tdmh
+
+        # place disponible en plus par cellule
+        self.delta_marj_w = tdltmw / (self.nb_w * 2)
+        self.delta_marj_h = tdltmh / (self.nb_h * 2)
+
+        # Marge des cellules
+        self.x_margin = self.ext_margin + self.int_margin + \
+            self.dec_margin + self.delta_marj_w
+        self.y_margin = self.ext_margin + self.int_margin + \
+            self.dec_margin + self.delta_marj_h
+
+        # Taille des cellules
+        self.x_size = final_w + self.dec_margin + self.delta_marj_w * 2
+        self.y_size = final_h + self.dec_margin + self.delta_marj_h * 2
+
+        if self.scale < 0:
+            logger.error(f"\tToo small page : scale={self.scale}<0")
+        if self.scale != 1 and warn:
+            logger.warning(
+                f"\tW/H={ini_w}/{ini_h}==>{self.data_w/2}/{self.data_h}")
+            logger.warning(f"\tSCALE: {self.scale}")
+
+    def compute_real_pos(self, x, y, r):
+        """ calcul graphique : index --> position """
+        r = 0
+        x_offset = self.data_w / 2 * int(x % 2 != 0)
+        pos_mat = [(round(x // 2) + r) * self.x_size + x_offset +
+                   self.x_margin, (float(y) + r) * self.y_size + self.y_margin]
+        # sr = -1 if r else 1
+        scale_mat = [self.scale, 0, 0, self.scale]
+        mat = scale_mat + pos_mat
+        return mat
+
+    def compute_real_pos_array(self, x, y, r):
+        """ compute_real_pos sur des tableaux --> matrices (n, 6) """
+        r = 0
+        x_offset = self.data_w / 2 * (x % 2 != 0)
+        mat = numpy.zeros((len(x), 6))
+        mat[:, 0] = mat[:, 3] = self.scale
+        mat[:, 4] = (x // 2 + r) * self.x_size + x_offset + self.x_margin
+        mat[:, 5] = (y + r) * self.y_size + self.y_margin
+        return mat
+
+    def geometry_key(self):
+        """ Clé de la géométrie complète (identifie un template) """
+        return (self.unit, self.global_w, self.global_h,
+                self.int_margin, self.ext_margin, self.nb_w, self.nb_h,
+                self.dec_margin, self.dec_line_coef, tuple(self.dec_color),
+                self.dec_keep_overflow, self.display_debug,
+                self.scale, self.data_w, self.data_h)
+
+    def create_marks(self):
+        """ Content stream (bytes) des traits de coupe du template """
+        return template_marks(self)
+
+    def create_template(self, namefile=None):
+        """
+        Create template pdf from self (one sheet with the crop marks)
+        Return the PDF as bytes, or write it to namefile if given
+        Kept for compatibility : impose() only uses create_marks(), through
+        TEMPLATE_CACHE
+        """
+        # pylint: disable=protected-access
+        out_pdf = PyPDF2.PdfFileWriter()
+        template_ref = out_pdf._addObject(
+            _template_xobject(self, self.create_marks()))
+        out_pdf.addPage(_new_sheet(self, template_ref))
+        if namefile is not None:
+            with open(namefile, 'wb') as file:
+                out_pdf.write(file)
+            return None
+        data = io.BytesIO()
+        out_pdf.write(data)
+        return data.getvalue()
+
+    def log(self):
+        """ debug data in log """
+        logger.debug(
+            f"\tOutSize    : W/H = {self.global_w}/{self.global_h} pt")
+        logger.debug(f"\tMarg INT : {self.int_margin} pt")
+        logger.debug(
+            f"\tMarg DEC : {self.dec_margin} pt @ {self.dec_line_coef*100}/100")
+        logger.debug(f"\tMarg EXT : {self.ext_margin} pt")
+        logger.debug(f"\tOverflow   : {self.dec_keep_overflow}")
+        logger.debug(f"\tDebug      : {self.display_debug}")
+
+
+class TemplateCache:
+    """
+    Cache LRU des templates (content stream des traits de coupe), indexé par
+    la géométrie complète. Optionnellement persisté dans cache_dir.
+    """
+
+    def __init__(self, maxsize=32, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+
+    def _path(self, key):
+        digest = sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"template-{digest}.marks")
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _store(self, key, data):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # écriture atomique : plusieurs jobs peuvent partager cache_dir
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp, self._path(key))
+
+    def get(self, template):
+        """ Retourne le template (bytes) de la géométrie courante """
+        key = template.geometry_key()
+        if key in self._entries:
+            logger.debug("\tTemplate cache: hit")
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        data = self._load(key)
+        if data is None:
+            logger.debug("\tTemplate cache: miss")
+            data = template.create_marks()
+            self._store(key, data)
+        else:
+            logger.debug(f"\tTemplate cache: hit ({self.cache_dir})")
+        self._entries[key] = data
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return data
+
+    def clear(self):
+        """ Vide le cache mémoire """
+        self._entries.clear()
+
+
+TEMPLATE_CACHE = TemplateCache()
+
+
+class SheetCache:
+    """
+    Cache disque des signatures imposées (feuille recto + verso, sérialisée
+    par FragmentWriter.to_bytes), indexé par l'empreinte du contenu de leurs
+    pages d'entrée et de leur placement. Chaque fichier commence par une
+    ligne JSON (clé, sha1 du fragment) vérifiée avant usage ; rien n'est
+    exécuté à la lecture. Au-delà de max_bytes, les signatures les moins
+    récemment utilisées sont supprimées.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"sheet-{key}.frag")
+
+    def get(self, key):
+        """ Fragment de la signature key, ou None (absent ou invalide) """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                header = json.loads(file.readline())
+                data = file.read()
+            if header["key"] != key or \
+                    header["sha1"] != sha1(data).hexdigest():
+                raise ValueError("key or digest mismatch")
+            fragment = FragmentWriter.from_bytes(data)
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            if not isinstance(ex, FileNotFoundError):
+                logger.debug(f"\tSheet cache: ignore {path} ({ex})")
+            return None
+        os.utime(path)                  # ordre LRU
+        return fragment
+
+    def put(self, key, fragment):
+        """ Enregistre le fragment de la signature key """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = fragment.to_bytes()
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as file:
+            file.write(json.dumps({"key": key,
+                                   "sha1": sha1(data).hexdigest()}).encode())
+            file.write(b"\n")
+            file.write(data)
+        os.replace(tmp, self._path(key))
+
+    def evict(self):
+        """ Supprime les signatures les plus anciennes au-delà de max_bytes """
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.name.startswith("sheet-")]
+        except OSError:
+            return
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size,
+                           entry.path) for entry in entries), reverse=True)
+        total = 0
+        for _, size, path in entries:
+            total += size
+            if total > self.max_bytes:
+                logger.debug(f"\tSheet cache: evict {path}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class ImposerAlgo:
+    """
+        Algorithme d'imposition
+        (i, in_nb_pages) ---> (x, y, outIndexPage)
+        in_nb_pages ---> outnb_pages
+    """
+
+    def __init__(self, nb_w, nb_h, method=None):
+        self.nb_w = nb_w                              # nb_w
+        self.nb_h = nb_h                              # nb_h
+        self.nb_cell = self.nb_w * 2 * self.nb_h      # nb cell
+        self.nb_in_pages = None
+        self.nb_out_pages = None
+        self.method = method                          # voir fold.fold_table
+        # (page{O 1}, x, y, rotate) par page de la signature
+        # https://app.lib.uliege.be/guide_catalo/wp-content/uploads/2020/05/Identificationdesformats.pdf
+        self.table = fold_table(nb_w, nb_h, method)
+
+    def compute_internals(self, nb_pages):
+        """ Compute internals """
+        nb_sign_pages = 2 * self.nb_cell              # pages par signature
+        self.nb_in_pages = nb_pages
+        self.nb_out_pages = (nb_pages // nb_sign_pages) * 2 + \
+            int((nb_pages % nb_sign_pages) > 0) * 2
+
+
+    def compute_index_pos(self, index):
+        """ Retourne la position impose """
+        assert index <= self.nb_in_pages - 1
+        half = index < self.nb_in_pages // 2  # begin or end
+        index = index if half else self.nb_in_pages - index - 1  # normalised index
+        entry = index % self.nb_cell
+        entry = entry if half else 2 * self.nb_cell - 1 - entry
+        page_offset, x, y, rotate = self.table[entry].tolist()
+        page = (index // self.nb_cell) * 2 + page_offset
+        assert page < self.nb_out_pages
+        return (page, x, y, rotate)
+
+    def compute_index_pos_array(self, index):
+        """ compute_index_pos sur un tableau d'index """
+        half = index < self.nb_in_pages // 2
+        index = numpy.where(half, index, self.nb_in_pages - index - 1)
+        entry = index % self.nb_cell
+        page_offset, x, y, rotate = self.table[
+            numpy.where(half, entry, 2 * self.nb_cell - 1 - entry)].T
+        page = (index // self.nb_cell) * 2 + page_offset
+        assert (page < self.nb_out_pages).all()
+        return (page, x, y, rotate)
+
+
+def compute_plan(imposer, template):
+    """
+    Placement plan of every input page, in one vectorized pass
+    Read-only PLAN_DTYPE array : (index, sheet, x, y, rotate, matrix)
+    """
+    index = numpy.arange(imposer.nb_in_pages)
+    page, x, y, rotate = imposer.compute_index_pos_array(index)
+    plan = numpy.empty(len(index), PLAN_DTYPE)
+    plan["index"] = index
+    plan["sheet"] = page
+    plan["x"] = x
+    plan["y"] = y
+    plan["rotate"] = rotate
+    plan["matrix"] = template.compute_real_pos_array(x, y, rotate)
+    plan.flags.writeable = False
+    return plan
+
+
+def export_plan(plan, filename):
+    """ Export the plan as JSON (one object per input page) """
+    with open(filename, 'w') as file:
+        json.dump([{"index": int(row["index"]), "sheet": int(row["sheet"]),
+                    "x": int(row["x"]), "y": int(row["y"]),
+                    "rotate": int(row["rotate"]),
+                    "matrix": row["matrix"].tolist()} for row in plan],
+                  file)
+
+
+def _plan_signatures(plan):
+    """ Découpe le plan par signature (recto + verso) """
+    order = numpy.argsort(plan["sheet"] // 2, kind="stable")
+    plan = plan[order]
+    bounds = numpy.flatnonzero(numpy.diff(plan["sheet"] // 2)) + 1
+    return numpy.split(plan, bounds)
+
+
+def _signature_sheets(signature):
+    """ Faces (recto, verso) de la signature, même vides """
+    recto = int(signature["sheet"][0]) // 2 * 2
+    return [recto, recto + 1]
+
+
+def _optimized(template, imposer, info, optimizer, *, objective="scale",
+               min_scale=None):
+    # pylint: disable=too-many-arguments, import-outside-toplevel
+    """ (template, imposer) de la meilleure mise en page pour info """
+    from hackimposition.layout import apply
+    from hackimposition.quoting import _best_layout
+    layout = _best_layout(info, optimizer, objective, min_scale)
+    logger.info(f"\tLayout {layout['sheet']}"
+                f"{' landscape' if layout['landscape'] else ''} "
+                f"{layout['nb_w']}x{layout['nb_h']}: scale {layout['scale']:.3f}"
+                f", {layout['impressions']} impressions")
+    template = apply(layout, copy.copy(template))
+    return (template, ImposerAlgo(template.nb_w, template.nb_h,
+                                  imposer.method))
+
+
+def _page_size(pdf):
+    """ Retourne la taille d'un PyPDF2 """
+    media_box = pdf.getPage(0).mediaBox
+    return (float(media_box.lowerRight[0] - media_box.lowerLeft[0]),
+            float(media_box.upperRight[1] - media_box.lowerRight[1]))
+
+
+# attributs hérités de l'arbre des pages (voir PdfFileReader._flatten)
+_INHERITED = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+class _Reader(PyPDF2.PdfFileReader):
+    """
+    PdfFileReader dont les pages déjà imposées peuvent être oubliées
+    (release_pages) : seule leur référence reste, elles sont relues depuis
+    l'arbre des pages si besoin
+    """
+
+    def release_pages(self, indexes):
+        """ Ne garde que la référence des pages indexes """
+        for i in indexes:
+            page = self.flattenedPages[i]
+            if getattr(page, "indirectRef", None) is not None:
+                self.flattenedPages[i] = page.indirectRef
+
+    def getPage(self, pageNumber):  # pylint: disable=invalid-name
+        page = super().getPage(pageNumber)
+        if isinstance(page, IndirectObject):
+            page = self.flattenedPages[pageNumber] = self._load_page(page)
+        return page
+
+    def _load_page(self, ref):
+        """ Page ref, avec les attributs hérités de ses parents """
+        page = PyPDF2.pdf.PageObject(self, ref)
+        page.update(ref.getObject())
+        for attr in _INHERITED:
+            node = page
+            while attr not in node and "/Parent" in node:
+                node = node["/Parent"]
+            if node is not page and attr in node:
+                page[NameObject(attr)] = node[attr]
+        return page
+
+
+def _open_pdf(filename):
+    """
+    PdfFileReader lisant le fichier à travers un mmap : les objets sont lus à
+    la demande depuis le cache disque au lieu de copier tout le fichier en
+    mémoire (ce que fait PyPDF2 avec un nom de fichier)
+    filename peut aussi être un objet bytes-like (voir buffers.read_source)
+    """
+    if isinstance(filename, str):
+        with open(filename, 'rb') as file:
+            filename = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    elif not hasattr(filename, "read"):
+        filename = MemoryReader(filename)
+    return _Reader(filename)
+
+
+def _read_pdf(filename):
+    pdf = _open_pdf(filename)
+    width, height = _page_size(pdf)
+    nb_pages = pdf.getNumPages()
+    for titre, elem in pdf.getDocumentInfo().items():
+        logger.debug("\t" + titre + ":" + elem)
+    logger.debug(f"\tnb_pages: {nb_pages}")
+    logger.debug(f"\tWidth:{width} height:{height}")
+    return (pdf, width, height, nb_pages)
+
+
+def _form_xobject(page):
+    """ PageObject --> Form XObject (contenu et ressources inchangés) """
+    contents = page.getContents()
+    if isinstance(contents, EncodedStreamObject):
+        # flux unique : recopie des données encodées, sans décodage
+        form = EncodedStreamObject()
+        form._data = contents._data  # pylint: disable=protected-access
+        for key in ("/Filter", "/DecodeParms"):
+            if key in contents:
+                form[NameObject(key)] = contents.raw_get(key)
+    else:
+        form = DecodedStreamObject()
+        if contents is None:
+            data = b""
+        elif isinstance(contents, DecodedStreamObject):
+            data = contents.getData()
+        else:  # tableau de flux
+            data = b"\n".join(stream.getObject().getData()
+                              for stream in contents)
+        form.setData(data)
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): page.mediaBox,
+        NameObject("/Resources"): page.get("/Resources", DictionaryObject()),
+    })
+    return form
+
+
+def _template_xobject(template, marks):
+    """ Content stream des traits de coupe --> Form XObject (compressé) """
+    form = EncodedStreamObject()
+    form._data = zlib.compress(marks)  # pylint: disable=protected-access
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/Filter"): NameObject("/FlateDecode"),
+        NameObject("/BBox"): RectangleObject(
+            [0, 0, template.global_w, template.global_h]),
+        NameObject("/Resources"): DictionaryObject(),
+    })
+    return form
+
+
+def _new_sheet(template, template_ref):
+    """ Feuille vide qui référence le template partagé """
+    page = PyPDF2.pdf.PageObject.createBlankPage(
+        None, template.global_w, template.global_h)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({
+            NameObject(_TEMPLATE_XOBJECT): template_ref})})
+    contents = DecodedStreamObject()
+    contents.setData(f"q {_TEMPLATE_XOBJECT} Do Q".encode())
+    page[NameObject("/Contents")] = contents
+    return page
+
+
+def _placement(name, mat):
+    """ Opérateurs plaçant le Form XObject name avec la matrice mat (cm) """
+    ctm = " ".join(f"{val:.6f}" for val in mat)
+    return f"\nq {ctm} cm {name} Do Q"
+
+
+def _place_xobject(page, name, xobject_ref, mat):
+    """ Place un Form XObject sur la feuille avec la matrice mat (cm) """
+    page["/Resources"]["/XObject"][NameObject(name)] = xobject_ref
+    contents = page["/Contents"]
+    contents.setData(contents.getData() + _placement(name, mat).encode())
+
+
+def _perform_imposition(plan, nb_sheets, template, in_pdf, marks, *,
+                        profiler=NULL_PROFILER, dedup=None):
+    # pylint: disable=protected-access, too-many-arguments
+    out_pdf = PyPDF2.PdfFileWriter()
+    # Les traits de coupe sont stockés une seule fois
+    template_ref = out_pdf._addObject(_template_xobject(template, marks))
+    # toutes les faces, y compris un dernier verso vide
+    sheets = [_new_sheet(template, template_ref) for _ in range(nb_sheets)]
+    for sheet in sheets:
+        out_pdf.addPage(sheet)
+
+    for i, ipage, x, y, rotate, pos in plan.tolist():
+        start = time.perf_counter()
+        form = _form_xobject(in_pdf.getPage(i))
+        if dedup is not None:
+            dedup.rewrite(form)
+        page_ref = out_pdf._addObject(form)
+        _place_xobject(sheets[ipage], _PAGE_XOBJECT.format(i), page_ref, pos)
+        profiler.page(i, time.perf_counter() - start)
+        logger.debug(f"\t[{i}/{len(plan)}]" +
+                     f"({i})->(page:{ipage}, x:{x}, y:{y}, r:{rotate})")
+    return out_pdf
+
+
+def _release_reader(pdf, pages=()):
+    """
+    Oublie les objets déjà résolus du lecteur et les pages déjà imposées
+    (voir _Reader) : seuls l'xref et les références des pages restent, les
+    objets seront relus depuis le mmap si besoin
+    """
+    pdf.resolvedObjects.clear()
+    pdf.release_pages(pages)
+
+
+def _impose_signature(out_pdf, template, in_pdf, template_ref, signature, *,
+                      profiler=NULL_PROFILER, forms=None):
+    # pylint: disable=too-many-arguments
+    """
+    Impose et écrit les feuilles d'une signature
+    forms : Form XObjects des pages déjà lus ({index: form}, pipeline) ; le
+    lecteur n'est alors pas vidé
+    """
+    sheets = {ipage: _new_sheet(template, template_ref)
+              for ipage in _signature_sheets(signature)}
+    for i, ipage, x, y, rotate, pos in signature.tolist():
+        start = time.perf_counter()
+        form = _form_xobject(in_pdf.getPage(i)) if forms is None else forms[i]
+        page_ref = out_pdf.add_object(form)
+        _place_xobject(sheets[ipage], _PAGE_XOBJECT.format(i), page_ref, pos)
+        profiler.page(i, time.perf_counter() - start)
+        logger.debug(f"\t({i})->(page:{ipage}, x:{x}, y:{y}, r:{rotate})")
+    for ipage, sheet in sheets.items():
+        out_pdf.add_page(ipage, sheet)
+    if forms is None:
+        _release_reader(in_pdf, signature["index"].tolist())
+
+
+def _pipeline_imposition(out_pdf, template, in_pdf, template_ref,
+                         signatures, *, profiler=NULL_PROFILER):
+    # pylint: disable=too-many-arguments
+    """
+    Les pages des signatures suivantes (et les objets qu'elles référencent)
+    sont lues par un thread pendant que la signature courante est assemblée
+    et écrite
+    """
+    reader = SharedReader(in_pdf)
+
+    def _fetch(signature):
+        forms = {i: _form_xobject(in_pdf.getPage(i))
+                 for i in signature["index"].tolist()}
+        return signature, forms, reader.resolve(forms.values())
+
+    try:
+        for signature, forms, keys in prefetch(_fetch, signatures):
+            _impose_signature(out_pdf, template, in_pdf, template_ref,
+                              signature, profiler=profiler, forms=forms)
+            reader.release(keys)
+            in_pdf.release_pages(signature["index"].tolist())
+    finally:
+        reader.close()
+
+
+_WORKER = {}
+
+
+def _worker_init(infile, template, template_idnum, pages_idnum, dedup,
+                 compress=False):
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    # (initargs du pool : arguments positionnels)
+    """ Etat d'un processus de travail (--jobs) """
+    _WORKER.update(pdf=_open_pdf(infile), template=template,
+                   template_idnum=template_idnum, pages_idnum=pages_idnum,
+                   dedup=Deduplicator() if dedup else None, compress=compress)
+
+
+def _impose_fragment(in_pdf, template, template_idnum, pages_idnum,
+                     signature, *, dedup, compress=False):
+    # pylint: disable=too-many-arguments
+    """ Impose une signature dans un fragment (FragmentWriter) """
+    fragment = FragmentWriter(pages_idnum, dedup, compress)
+    _impose_signature(fragment, template, in_pdf,
+                      fragment.out_ref(template_idnum), signature)
+    return fragment
+
+
+def _worker_impose(signature):
+    """ Impose une signature dans un fragment (processus de travail) """
+    return _impose_fragment(_WORKER["pdf"], _WORKER["template"],
+                            _WORKER["template_idnum"], _WORKER["pages_idnum"],
+                            signature, dedup=_WORKER["dedup"],
+                            compress=_WORKER["compress"])
+
+
+# à changer si le contenu d'un fragment change pour un même plan
+_SHEET_FORMAT = 1
+
+
+def _signature_key(in_pdf, template, signature, dedup, *context):
+    """
+    Empreinte d'une signature : contenu et ressources de ses pages d'entrée,
+    placement, taille des feuilles et context (objets de sortie référencés,
+    compression)
+    None si une page atteint un cycle d'objets (signature non cachable)
+    """
+    key = sha1(repr((__VERSION__, _SHEET_FORMAT, template.global_w,
+                     template.global_h, context)).encode())
+    key.update(signature.tobytes())
+    for i in signature["index"].tolist():
+        digest = dedup.content_digest(_form_xobject(in_pdf.getPage(i)))
+        if digest is None:
+            return None
+        key.update(digest)
+    return key.hexdigest()
+
+
+def _incremental_imposition(out_pdf, template, in_pdf, template_ref,
+                            signatures, *, sheet_cache, jobs, infile,
+                            compress=False):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """
+    Les signatures dont les pages et le placement n'ont pas changé sont
+    reprises de sheet_cache ; les autres sont imposées puis ajoutées au cache
+    """
+    dedup = Deduplicator()
+    idnums = (template_ref.idnum, out_pdf.pages_ref.idnum)
+    keys = []
+    for signature in signatures:
+        keys.append(_signature_key(in_pdf, template, signature, dedup,
+                                   *idnums, compress))
+        _release_reader(in_pdf, signature["index"].tolist())
+    fragments = [sheet_cache.get(key) if key else None for key in keys]
+    todo = [signature for signature, fragment in zip(signatures, fragments)
+            if fragment is None]
+    logger.info(f"\tSheet cache: {len(signatures) - len(todo)}/"
+                f"{len(signatures)} signatures reused")
+
+    pool = None
+    if jobs > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(jobs, _worker_init,
+                                    (infile, template, *idnums, True,
+                                     compress))
+        imposed = pool.imap(_worker_impose, todo)
+    else:
+        imposed = (_impose_fragment(in_pdf, template, *idnums, signature,
+                                    dedup=dedup, compress=compress)
+                   for signature in todo)
+    try:
+        for key, fragment in zip(keys, fragments):
+            if fragment is None:
+                fragment = next(imposed)
+                if key is not None:
+                    sheet_cache.put(key, fragment)
+            out_pdf.add_fragment(fragment)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    sheet_cache.evict()
+
+
+def _stream_imposition(plan, template, in_pdf, marks, stream, *, infile,
+                       infos, jobs=1, profiler=NULL_PROFILER, dedup=True,
+                       sheet_cache=None, compress=False, object_streams=False,
+                       pipeline=False, forms=None):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """
+    Imposition signature par signature, écrite au fur et à mesure
+    Avec jobs > 1, les signatures sont imposées par un pool de processus
+    puis écrites dans l'ordre : le fichier est identique au cas jobs == 1
+    (pas de temps par page dans ce cas).
+    Avec sheet_cache (SheetCache), seules les signatures modifiées depuis la
+    dernière imposition sont imposées (dédoublonnage toujours actif).
+    compress, object_streams : voir writer.StreamingPdfWriter
+    pipeline : le fichier est écrit par un thread ; sans jobs ni sheet_cache,
+    les pages sont lues d'avance par un autre thread (voir pipeline)
+    forms : Form XObjects des pages ({index: form}) partagés entre plusieurs
+    impositions (impose_variants) ; dedup peut alors être un Deduplicator
+    partagé lui aussi
+    """
+    if pipeline:
+        stream = BackgroundWriter(stream)
+    if not isinstance(dedup, Deduplicator):
+        dedup = Deduplicator() if dedup else None
+    out_pdf = StreamingPdfWriter(stream, dedup=dedup,
+                                 compress=compress,
+                                 object_streams=object_streams)
+    template_ref = out_pdf.add_object(_template_xobject(template, marks))
+    signatures = _plan_signatures(plan)
+
+    if sheet_cache is not None:
+        _incremental_imposition(out_pdf, template, in_pdf, template_ref,
+                                signatures, sheet_cache=sheet_cache,
+                                jobs=jobs, infile=infile, compress=compress)
+    elif jobs > 1:
+        initargs = (infile, template, template_ref.idnum,
+                    out_pdf.pages_ref.idnum, bool(dedup), compress)
+        with multiprocessing.Pool(jobs, _worker_init, initargs) as pool:
+            for fragment in pool.imap(_worker_impose, signatures):
+                out_pdf.add_fragment(fragment)
+    elif pipeline:
+        _pipeline_imposition(out_pdf, template, in_pdf, template_ref,
+                             signatures, profiler=profiler)
+    else:
+        for signature in signatures:
+            _impose_signature(out_pdf, template, in_pdf, template_ref,
+                              signature, profiler=profiler, forms=forms)
+    out_pdf.close(infos)
+    if pipeline:
+        stream.close()
+
+
+def chunk_files(outfile, nb_chunks):
+    """ Fichiers (parties, manifeste) de la sortie découpée outfile """
+    root = outfile[:-4] if outfile.endswith(".pdf") else outfile
+    return ([f"{root}-{index:04d}.pdf" for index in range(1, nb_chunks + 1)],
+            f"{root}-manifest.json")
+
+
+def _write_manifest(filename, manifest):
+    """ Remplace le manifeste d'un coup : il est lu pendant l'imposition """
+    with open(filename + ".tmp", 'w') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(filename + ".tmp", filename)
+
+
+def _chunked_imposition(plan, template, in_pdf, marks, outfile, *, nb_sheets,
+                        infile, infos, chunk, jobs=1, profiler=NULL_PROFILER,
+                        dedup=True, compress=False, object_streams=False,
+                        pipeline=False, forms=None, verify="fast"):
+    # pylint: disable=too-many-arguments, too-many-locals
+    """
+    Un PDF autonome (template, polices, images recopiés) par groupe de chunk
+    signatures, écrit dès que ses feuilles sont imposées puis vérifié ; le
+    manifeste liste les parties terminées, dans l'ordre d'impression.
+    Une partie n'apparaît sous son nom qu'une fois complète.
+    """
+    signatures = _plan_signatures(plan)
+    groups = [signatures[start:start + chunk]
+              for start in range(0, len(signatures), chunk)]
+    files, manifest_file = chunk_files(outfile, len(groups))
+    manifest = {"title": infos['/Title'], "nb_in_pages": len(plan),
+                "nb_out_pages": nb_sheets,
+                "nb_chunks": len(groups), "complete": False, "chunks": []}
+    _write_manifest(manifest_file, manifest)
+    if not isinstance(dedup, Deduplicator):
+        # empreintes partagées, objets recopiés dans chaque partie
+        dedup = Deduplicator() if dedup else None
+
+    pool, imposed = None, None
+    try:
+        for index, (group, filename) in enumerate(zip(groups, files)):
+            with open(filename + ".part", 'wb') as file:
+                stream = BackgroundWriter(file) if pipeline else file
+                out_pdf = StreamingPdfWriter(stream, dedup=dedup,
+                                             compress=compress,
+                                             object_streams=object_streams)
+                template_ref = out_pdf.add_object(
+                    _template_xobject(template, marks))
+                if jobs > 1 and pool is None:
+                    # numéros des objets partagés identiques dans chaque partie
+                    pool = multiprocessing.Pool(jobs, _worker_init, (
+                        infile, template, template_ref.idnum,
+                        out_pdf.pages_ref.idnum, bool(dedup), compress))
+                    imposed = pool.imap(_worker_impose, signatures)
+                if imposed is not None:
+                    for _ in group:
+                        out_pdf.add_fragment(next(imposed))
+                elif pipeline:
+                    _pipeline_imposition(out_pdf, template, in_pdf,
+                                         template_ref, group,
+                                         profiler=profiler)
+                else:
+                    for signature in group:
+                        _impose_signature(out_pdf, template, in_pdf,
+                                          template_ref, signature,
+                                          profiler=profiler, forms=forms)
+                out_pdf.close(dict(infos, **{'/Title': (
+                    f"{infos['/Title']} ({index + 1}/{len(groups)})")}))
+                if pipeline:
+                    stream.close()
+            sheets = [ipage for signature in group
+                      for ipage in _signature_sheets(signature)]
+            _verify(filename + ".part", verify, len(sheets),
+                    template.global_w, template.global_h)
+            os.replace(filename + ".part", filename)
+            manifest["chunks"].append({
+                "file": os.path.basename(filename), "nb_pages": len(sheets),
+                "first_sheet": sheets[0], "last_sheet": sheets[-1]})
+            _write_manifest(manifest_file, manifest)
+            logger.info(f"\tChunk {index + 1}/{len(groups)}: {filename}")
+    except BaseException as ex:
+        manifest["error"] = f"{type(ex).__name__}: {ex}"
+        _write_manifest(manifest_file, manifest)
+        raise
+    finally:
+        if pool is not None:
+            pool.terminate()
+    manifest["complete"] = True
+    _write_manifest(manifest_file, manifest)
+
+
+class PyPDF2Backend:
+    """ Backend PyPDF2 (voir backends) """
+
+    name = "pypdf2"
+    streaming = True
+
+    @staticmethod
+    def read(filename):
+        """ filename --> (pdf, largeur, hauteur, nombre de pages) """
+        return _read_pdf(filename)
+
+    @staticmethod
+    def impose(plan, nb_sheets, template, in_pdf, marks, *,
+               profiler=NULL_PROFILER, dedup=True):
+        # pylint: disable=too-many-arguments
+        """ Impose le plan sur nb_sheets faces ; retourne le PdfFileWriter """
+        return _perform_imposition(
+            plan, nb_sheets, template, in_pdf, marks, profiler=profiler,
+            dedup=Deduplicator() if dedup else None)
+
+    @staticmethod
+    def write(out_pdf, outfile, infos, *, compress=False,
+              object_streams=False):
+        """
+        Ecrit le PdfFileWriter de sortie dans outfile (nom ou fichier)
+        PdfFileWriter n'écrit qu'une xref classique sans compression : la
+        sortie compressée recopie ses feuilles avec un StreamingPdfWriter
+        """
+        with writable(outfile) as file:
+            if not (compress or object_streams):
+                out_pdf.addMetadata(infos)
+                out_pdf.write(file)
+                return
+            writer = StreamingPdfWriter(file, compress=compress,
+                                        object_streams=object_streams)
+            for index in range(out_pdf.getNumPages()):
+                writer.add_page(index, out_pdf.getPage(index))
+            writer.close(infos)
+
+
+def impose(template, imposer, infile, outfile, *, cache=None, stream=False,
+           jobs=1, plan_file=None, profiler=None, profile_file=None,
+           verify="fast", dedup=True, sheet_cache=None, backend=None,
+           compress=False, object_streams=False, linearize=False,
+           pipeline=False, parsed=None, chunk=None, optimize=None):
+    # pylint: disable=too-many-arguments, too-many-locals, too-many-statements
+    # pylint: disable=too-many-branches
+    """
+    main func : impose infile (options are keyword-only)
+    infile: file name, "-" (stdin), bytes-like object (read in place) or
+    binary file object
+    outfile: file name, "-" (stdout), writable binary file object, or None :
+    the imposed PDF is returned as bytes. Outputs that are not file names
+    are kept in memory until verified and linearized, except with
+    verify="none" and without linearize (written as they are imposed).
+    stream: write each signature as soon as it is imposed (bounded memory)
+    jobs: number of processes imposing signatures (implies stream)
+    plan_file: export the placement plan as JSON
+    profiler: profiling.Profiler measuring each stage
+    profile_file: write the measures as JSON (creates a Profiler if needed)
+    verify: check of the written file, "none", "fast" (structure) or "full"
+    dedup: write identical input objects (fonts, images...) only once
+    sheet_cache: SheetCache, only re-impose the signatures whose input pages
+    changed since the last run (implies stream and dedup)
+    backend: name of the PDF backend (see backends), default PyPDF2
+    compress: Flate compress the generated content streams
+    object_streams: pack the objects in object streams, xref stream (PDF 1.5)
+    linearize: rewrite the output for fast web view (needs pikepdf)
+    pipeline: read, impose and write concurrently on threads (implies stream)
+    parsed: infile already parsed, shared with other impositions (see
+    impose_variants) ; backend is then the one of parsed
+    chunk: write one self-contained PDF per chunk signatures as soon as they
+    are imposed and verified, listed in order in a JSON manifest (see
+    chunk_files ; implies stream, outfile must be a file name)
+    optimize: dict(optimizer=layout.LayoutOptimizer, objective, min_scale),
+    impose with the best layout for infile instead of the one of template
+    (see quote())
+    """
+    cache = TEMPLATE_CACHE if cache is None else cache
+    backend = get_backend(backend) if parsed is None else parsed.backend
+    name = source_name(infile)
+    out_name = outfile if isinstance(outfile, str) else source_name(outfile)
+    if parsed is not None and parsed.forms is not None:
+        # PdfFileWriter modifierait les objets lus, partagés
+        stream = True
+    streaming = stream or jobs > 1 or sheet_cache is not None or pipeline \
+        or chunk
+    if streaming and not backend.streaming:
+        raise ValueError(f"Backend {backend.name} does not support "
+                         "stream, jobs, sheet_cache, pipeline or chunk")
+    if chunk and (not is_path(outfile) or sheet_cache is not None or
+                  linearize):
+        raise ValueError("chunk needs an output file name, without "
+                         "sheet_cache or linearize")
+    owned = profiler is None
+    if owned:
+        profiler = Profiler() if profile_file else NULL_PROFILER
+    try:
+        logger.info(">>> Config")
+        logger.debug(f"\tInfile     : {name}")
+        logger.debug(f"\tOutfile    : {out_name}")
+        template.log()
+
+        if parsed is None:
+            logger.info(f">>> Parse {name}")
+            with profiler.stage("Parse"):
+                infile = read_source(infile)
+                in_pdf, in_width, in_height, in_nb_pages = backend.read(infile)
+        else:
+            infile = parsed.source
+            in_pdf, in_width, in_height, in_nb_pages = \
+                parsed.pdf, parsed.width, parsed.height, parsed.nb_pages
+
+        if optimize:
+            logger.info(">>> Layout")
+            with profiler.stage("Layout"):
+                template, imposer = _optimized(
+                    template, imposer, (in_nb_pages, in_width, in_height),
+                    **optimize)
+
+        logger.info(">>> Initialisation template")
+        with profiler.stage("Initialisation template"):
+            template.compute_internals(in_width, in_height)
+
+        logger.info(">>> Initialisation algorithme")
+        with profiler.stage("Initialisation algorithme"):
+            imposer.compute_internals(in_nb_pages)
+            plan = compute_plan(imposer, template)
+            if plan_file:
+                export_plan(plan, plan_file)
+
+        logger.info(">>> Create template")
+        with profiler.stage("Create template"):
+            marks = cache.get(template)
+
+        infos = {'/Title': f"imposition from {name}",
+                 '/Creator': (__PRGM__ + " " + __VERSION__ + " " +
+                              __COPYRIGHT__)}
+        # sortie en mémoire : vérifiée (et linéarisée) avant d'être livrée
+        buffered = not is_path(outfile) and (
+            outfile is None or verify != "none" or linearize)
+        target = io.BytesIO() if buffered else outfile
+        if chunk:
+            logger.info(f">>> Imposition + Write {out_name} ({chunk} "
+                        f"signatures per file, jobs={jobs})")
+            with profiler.stage("Imposition + Write + Check"):
+                _chunked_imposition(
+                    plan, template, in_pdf, marks, outfile,
+                    nb_sheets=imposer.nb_out_pages, infile=infile,
+                    infos=infos, chunk=chunk, jobs=jobs, profiler=profiler,
+                    dedup=parsed.dedup if parsed and dedup else dedup,
+                    compress=compress, object_streams=object_streams,
+                    pipeline=pipeline,
+                    forms=parsed.forms if parsed else None, verify=verify)
+        elif streaming:
+            logger.info(f">>> Imposition + Write {out_name} (stream, "
+                        f"jobs={jobs})")
+            with profiler.stage("Imposition + Write"), \
+                    writable(target) as file:
+                _stream_imposition(
+                    plan, template, in_pdf, marks, file, infile=infile,
+                    infos=infos, jobs=jobs, profiler=profiler,
+                    dedup=parsed.dedup if parsed and dedup else dedup,
+                    sheet_cache=sheet_cache, compress=compress,
+                    object_streams=object_streams, pipeline=pipeline,
+                    forms=parsed.forms if parsed else None)
+        else:
+            logger.info(f">>> Imposition {out_name} ({backend.name})")
+            with profiler.stage("Imposition"):
+                out_pdf = backend.impose(plan, imposer.nb_out_pages, template,
+                                         in_pdf, marks, profiler=profiler,
+                                         dedup=dedup)
+            logger.info(f">>> Write {out_name}")
+            with profiler.stage("Write"):
+                backend.write(out_pdf, target, infos, compress=compress,
+                              object_streams=object_streams)
+
+        if linearize:
+            # pylint: disable=import-outside-toplevel
+            from hackimposition.pikepdf_backend import linearize as _linearize
+            logger.info(f">>> Linearize {out_name}")
+            with profiler.stage("Linearize"):
+                if buffered:
+                    linearized = io.BytesIO()
+                    _linearize(target.getbuffer(), object_streams, linearized)
+                    target = linearized
+                else:
+                    _linearize(target, object_streams)
+
+        data = target.getvalue() if buffered else None
+        if not chunk:
+            # chaque partie est vérifiée avant d'être listée
+            logger.info(f">>> Check {out_name} ({verify})")
+            with profiler.stage("Check"):
+                _verify(target if data is None else data, verify,
+                        imposer.nb_out_pages, template.global_w,
+                        template.global_h)
+        if buffered and outfile is not None:
+            with writable(outfile) as file:
+                file.write(data)
+                file.flush()
+
+        if profile_file:
+            profiler.infos.update(infile=name, outfile=out_name,
+                                  nb_in_pages=imposer.nb_in_pages,
+                                  nb_out_pages=imposer.nb_out_pages)
+            profiler.dump(profile_file)
+    finally:
+        if owned:
+            profiler.close()
+    logger.info(">>> DONE")
+    return data if outfile is None else None
+
+
+def _impose_file(args):
+    """ impose() d'un fichier du lot ; les erreurs sont retournées """
+    template, imposer, infile, outfile, options = args
+    start = time.perf_counter()
+    try:
+        data = impose(template, imposer, infile, outfile, **options)
+        outfile = data if outfile is None else outfile
+        error = None
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.error(f"\t{source_name(infile)}: {ex}")
+        error = f"{type(ex).__name__}: {ex}"
+    return (infile, outfile, time.perf_counter() - start, error)
+
+
+def impose_many(template, imposer, files, workers=1, **options):
+    """
+    Impose a batch of files : files = [(infile, outfile)...] (see impose())
+    The template and the template cache are shared by all files of a worker.
+    Return [(infile, outfile, seconds, error)...], error is None on success ;
+    outfile is the imposed PDF (bytes) where it was None.
+    """
+    start = time.perf_counter()
+    if workers > 1 and len(files) > 1:
+        # les processus du pool ne peuvent pas en créer d'autres
+        options['jobs'] = 1
+    tasks = [(template, imposer, infile, outfile, options)
+             for infile, outfile in files]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            results = pool.map(_impose_file, tasks, chunksize=1)
+    else:
+        results = [_impose_file(task) for task in tasks]
+    _summary(results, start)
+    return results
+
+
+def _summary(results, start):
+    """ Bilan d'impose_many / impose_variants """
+    logger.info(">>> Summary")
+    for infile, outfile, seconds, error in results:
+        infile = source_name(infile)
+        if error is None:
+            outfile = outfile if isinstance(outfile, str) else \
+                source_name(outfile)
+            logger.info(f"\tOK   {seconds:7.2f}s {infile} -> {outfile}")
+        else:
+            logger.error(f"\tFAIL {seconds:7.2f}s {infile}: {error}")
+    nb_errors = sum(error is not None for *_, error in results)
+    logger.info(f"\t{len(results) - nb_errors}/{len(results)} files in "
+                f"{time.perf_counter() - start:.2f}s")
+
+
+class _FormCache(dict):
+    """ {index: Form XObject} des pages de pdf, construits à la demande """
+
+    def __init__(self, pdf):
+        super().__init__()
+        self.pdf = pdf
+
+    def __missing__(self, index):
+        form = self[index] = _form_xobject(self.pdf.getPage(index))
+        return form
+
+
+class _ParsedInput:
+    """
+    PDF d'entrée lu une seule fois pour plusieurs impositions
+    Avec PyPDF2, les Form XObjects des pages et les empreintes des objets
+    qu'elles référencent sont partagés aussi (ils restent en mémoire).
+    """
+
+    def __init__(self, infile, backend=None):
+        self.infile = infile
+        self.source = read_source(infile)
+        self.backend = get_backend(backend)
+        self.pdf, self.width, self.height, self.nb_pages = \
+            self.backend.read(self.source)
+        self.forms = _FormCache(self.pdf) \
+            if isinstance(self.backend, PyPDF2Backend) else None
+        self.dedup = Deduplicator()
+
+    def warm(self):
+        """ Lit toutes les pages et calcule leurs empreintes (avant un fork) """
+        if self.forms is not None:
+            for index in range(self.nb_pages):
+                self.dedup.content_digest(self.forms[index])
+
+
+_VARIANT_TASKS = []
+
+
+def _impose_variant(index):
+    """ Variante index (processus créé par fork : entrée lue héritée) """
+    return _impose_file(_VARIANT_TASKS[index])
+
+
+def impose_variants(variants, infile, workers=1, backend=None, **options):
+    """
+    Impose infile once per variant : variants = [(template, imposer, outfile)...]
+    (press formats, page orders...). The input is parsed once ; with the
+    pypdf2 backend, its pages and the content hashes of their objects are
+    shared by all variants too (implies stream).
+    workers > 1 : variants imposed concurrently by forked processes that
+    inherit the parsed input (one after the other where fork is unavailable).
+    Other options : see impose(). Return [(infile, outfile, seconds, error)...]
+    like impose_many.
+    """
+    start = time.perf_counter()
+    logger.info(f">>> Parse {source_name(infile)} ({len(variants)} variants)")
+    parsed = _ParsedInput(infile, backend)
+    concurrent = workers > 1 and len(variants) > 1 and \
+        "fork" in multiprocessing.get_all_start_methods()
+    if concurrent:
+        # les processus du pool ne peuvent pas en créer d'autres
+        options['jobs'] = 1
+    _VARIANT_TASKS[:] = [(template, imposer, infile, outfile,
+                          dict(options, parsed=parsed))
+                         for template, imposer, outfile in variants]
+    try:
+        if concurrent:
+            parsed.warm()
+            with multiprocessing.get_context("fork").Pool(
+                    min(workers, len(variants))) as pool:
+                results = pool.map(_impose_variant, range(len(variants)),
+                                   chunksize=1)
+        else:
+            results = [_impose_variant(index)
+                       for index in range(len(variants))]
+    finally:
+        _VARIANT_TASKS.clear()
+    _summary(results, start)
+    return results
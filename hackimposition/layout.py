@@ -0,0 +1,172 @@
+"""
+Layout optimizer (--optimize) : stock sheet, orientation, grid and margins of
+the template that give the largest pages or the fewest impressions
+
+Every candidate (sheet x orientation x nb_w x nb_h x int_margin x ext_margin)
+is evaluated at once with numpy, with the formulas of
+ImposerPageTemplate.compute_internals. The scales are memoized per input page
+size : choosing the layout of a job is then a lookup.
+"""
+
+from collections import OrderedDict
+import numpy
+from hackimposition.fold import NATURAL
+from hackimposition.imposition import mmtopt
+
+# Formats de papier (largeur, hauteur en mm, portrait)
+SHEETS = {
+    "A4": (210, 297),
+    "A3": (297, 420),
+    "SRA3": (320, 450),
+    "A2": (420, 594),
+    "SRA2": (450, 640),
+    "B2": (500, 707),
+    "A1": (594, 841),
+    "B1": (707, 1000),
+}
+OBJECTIVES = ("scale", "impressions")
+
+
+def _steps(bounds, steps):
+    """ Valeurs essayées dans [min, max] (une seule si min == max) """
+    low, high = (bounds, bounds) if numpy.isscalar(bounds) else bounds
+    return numpy.linspace(low, high, steps if high > low else 1)
+
+
+class LayoutOptimizer:
+    """
+    Candidats de mise en page d'un template (dec_margin, dec_line_coef...
+    conservés) ; best() les classe pour une taille et un nombre de pages
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, template, sheets=None, max_w=8, max_h=8,
+                 int_margins=None, ext_margins=None, steps=5,
+                 method=None, maxsize=256):
+        # pylint: disable=too-many-arguments
+        """
+        sheets: names of SHEETS (default all)
+        max_w, max_h: largest grid tried (cells in width, in height)
+        int_margins, ext_margins: value or (min, max) bounds tried in steps
+        values (default the margins of template)
+        method: page order ; folds need power of two grids
+        """
+        self.template = template
+        self.method = method
+        names = list(SHEETS) if sheets is None else list(sheets)
+        for name in names:
+            if name not in SHEETS:
+                raise ValueError(f"Unknown sheet {name} (expected one of "
+                                 f"{', '.join(SHEETS)})")
+        # portrait et paysage
+        sizes = numpy.array([[mmtopt(val) for val in SHEETS[name]]
+                             for name in names] * 2)
+        sizes[len(names):] = sizes[len(names):, ::-1]
+        self._names = numpy.array(names * 2)
+        self._landscape = numpy.repeat([False, True], len(names))
+
+        nb_w, nb_h = numpy.arange(1, max_w + 1), numpy.arange(1, max_h + 1)
+        int_margins = _steps(template.int_margin if int_margins is None
+                             else int_margins, steps)
+        ext_margins = _steps(template.ext_margin if ext_margins is None
+                             else ext_margins, steps)
+        grid = [val.ravel() for val in numpy.meshgrid(
+            numpy.arange(len(sizes)), nb_w, nb_h, int_margins, ext_margins,
+            indexing="ij")]
+        if (method or NATURAL) != NATURAL:
+            keep = ((grid[1] & (grid[1] - 1)) == 0) & \
+                ((grid[2] & (grid[2] - 1)) == 0)
+            grid = [val[keep] for val in grid]
+        self.sheet, nb_w, nb_h, self.int_margin, self.ext_margin = grid
+        self.nb_w, self.nb_h = nb_w.astype(numpy.int64), nb_h.astype(numpy.int64)
+        self.global_w, self.global_h = sizes[self.sheet].T
+        self.area = self.global_w * self.global_h
+
+        # place des cellules, sans l'échelle (voir compute_internals)
+        dec = template.dec_margin
+        self._cell_w = (self.global_w - dec * (self.nb_w + 1) -
+                        2 * self.ext_margin) / self.nb_w - 2 * self.int_margin
+        self._cell_h = (self.global_h - dec * (self.nb_h + 1) -
+                        2 * self.ext_margin) / self.nb_h - 2 * self.int_margin
+        self._maxsize = maxsize
+        self._scales = OrderedDict()        # (largeur, hauteur) --> échelles
+        self._best = OrderedDict()          # arguments de best() --> résultat
+
+    def __len__(self):
+        return len(self.nb_w)
+
+    @staticmethod
+    def _remember(cache, key, value, maxsize):
+        cache[key] = value
+        if len(cache) > maxsize:
+            cache.popitem(last=False)
+        return value
+
+    def scales(self, width, height):
+        """ Echelle des pages width x height de chaque candidat (mémoïsée) """
+        key = (float(width), float(height))
+        if key in self._scales:
+            self._scales.move_to_end(key)
+            return self._scales[key]
+        scale = numpy.minimum(self._cell_w / (2 * key[0]),
+                              self._cell_h / key[1])
+        scale.flags.writeable = False
+        return self._remember(self._scales, key, scale, self._maxsize)
+
+    def impressions(self, nb_pages):
+        """ Faces de feuille imprimées par exemplaire, pour chaque candidat """
+        nb_sign_pages = 4 * self.nb_w * self.nb_h
+        return -(-nb_pages // nb_sign_pages) * 2
+
+    def best(self, width, height, nb_pages, objective="scale",
+             min_scale=None, top=1, max_scale=1.):
+        # pylint: disable=too-many-arguments
+        """
+        The top best layouts for nb_pages pages of width x height (memoized)
+        objective "scale": largest pages (scales above max_scale count as
+        max_scale, None : no limit), then fewest impressions
+        objective "impressions": fewest impressions with a scale of at least
+        min_scale (default 1), then largest pages
+        Ties go to the smallest sheet. Return a list of dicts (see apply()),
+        empty if no candidate fits.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective} (expected one "
+                             f"of {', '.join(OBJECTIVES)})")
+        key = (float(width), float(height), nb_pages, objective, min_scale,
+               top, max_scale)
+        if key in self._best:
+            self._best.move_to_end(key)
+            return self._best[key]
+
+        scale = self.scales(width, height)
+        sides = self.impressions(nb_pages)
+        if objective == "scale":
+            fits = scale > (0 if min_scale is None else min_scale - 1e-9)
+            order = numpy.lexsort((self.area, sides, -scale if max_scale is
+                                   None else -numpy.minimum(scale, max_scale)))
+        else:
+            fits = scale >= (1 if min_scale is None else min_scale) - 1e-9
+            order = numpy.lexsort((self.area, -scale, sides))
+        order = order[fits[order]][:top]
+        layouts = [{
+            "sheet": str(self._names[self.sheet[index]]),
+            "landscape": bool(self._landscape[self.sheet[index]]),
+            "global_w": float(self.global_w[index]),
+            "global_h": float(self.global_h[index]),
+            "nb_w": int(self.nb_w[index]),
+            "nb_h": int(self.nb_h[index]),
+            "int_margin": float(self.int_margin[index]),
+            "ext_margin": float(self.ext_margin[index]),
+            "scale": float(scale[index]),
+            "impressions": int(sides[index]),
+        } for index in order.tolist()]
+        return self._remember(self._best, key, layouts, self._maxsize)
+
+
+def apply(layout, template):
+    """ Set the geometry of layout (a result of best()) on template """
+    for key in ("global_w", "global_h", "nb_w", "nb_h", "int_margin",
+                "ext_margin"):
+        setattr(template, key, layout[key])
+    return template
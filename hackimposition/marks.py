@@ -0,0 +1,122 @@
+"""
+Crop marks of the template, written directly as a PDF content stream
+
+The geometry of every mark of every cell is computed at once with numpy, then
+formatted with one format string per mark : no intermediate PDF document.
+Coordinates follow the PDF convention (origin at the bottom left, in pt).
+"""
+
+import numpy
+
+LINE_WIDTH = 0.57                   # 0.2 mm
+_KAPPA = 4 / 3 * (2 ** 0.5 - 1)     # points de contrôle d'un quart de cercle
+
+# 2 traits + un cercle (4 courbes de Bézier)
+_HIRONDELLE = ("{:.2f} {:.2f} m {:.2f} {:.2f} l S\n"
+               "{:.2f} {:.2f} m {:.2f} {:.2f} l S\n"
+               "{:.2f} {:.2f} m " + "{:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c\n" * 3 +
+               "{:.2f} {:.2f} {:.2f} {:.2f} {:.2f} {:.2f} c S\n")
+_LINE = "{:.2f} {:.2f} m {:.2f} {:.2f} l S\n"
+
+
+def _color(rgb):
+    return "{:.3f} {:.3f} {:.3f} RG\n".format(*(val / 255 for val in rgb))
+
+
+def _dash(ratio):
+    """ Pointillés de période 10 pt, ratio de trait """
+    return f"[{10 * ratio:.3f} {10 * (1 - ratio):.3f}] 0 d\n"
+
+
+def _cells(template):
+    """ Coins bas-gauche (x, y) des zones de données de toutes les cellules """
+    col, row = numpy.meshgrid(numpy.arange(template.nb_w),
+                              numpy.arange(template.nb_h), indexing="ij")
+    return (col.ravel() * template.x_size + template.x_margin,
+            row.ravel() * template.y_size + template.y_margin)
+
+
+def _hirondelles(template):
+    """
+    Hirondelles des 4 coins de chaque cellule
+    https://fr.wikipedia.org/wiki/Hirondelle_(imprimerie)
+    """
+    x, y = _cells(template)
+    marg_w = template.int_margin + \
+        (template.delta_marj_w if template.dec_keep_overflow else 0)
+    marg_h = template.int_margin + \
+        (template.delta_marj_h if template.dec_keep_overflow else 0)
+    size, coef = template.dec_margin, template.dec_line_coef
+
+    # coin (x0, y0) et longueurs signées (lx, ly) vers l'extérieur
+    x0 = numpy.stack([x - marg_w, x - marg_w,
+                      x + template.data_w + marg_w,
+                      x + template.data_w + marg_w], axis=1).ravel()
+    y0 = numpy.stack([y - marg_h, y + template.data_h + marg_h,
+                      y - marg_h, y + template.data_h + marg_h], axis=1).ravel()
+    lx = numpy.tile([-size, -size, size, size], len(x))
+    ly = numpy.tile([-size, size, -size, size], len(x))
+    y0 = template.global_h - y0                 # origine en bas à gauche
+    ly = -ly
+
+    c_x, c_y = x0 + lx / 2, y0 + ly / 2
+    rad = numpy.abs(lx) / 4
+    kap = _KAPPA * rad
+    coords = numpy.stack([
+        x0, y0 + coef * ly, x0, y0 + ly - coef * ly,
+        x0 + coef * lx, y0, x0 + lx - coef * lx, y0,
+        c_x + rad, c_y,
+        c_x + rad, c_y + kap, c_x + kap, c_y + rad, c_x, c_y + rad,
+        c_x - kap, c_y + rad, c_x - rad, c_y + kap, c_x - rad, c_y,
+        c_x - rad, c_y - kap, c_x - kap, c_y - rad, c_x, c_y - rad,
+        c_x + kap, c_y - rad, c_x + rad, c_y - kap, c_x + rad, c_y,
+    ], axis=1)
+    return _color(template.dec_color) + "".join(
+        _HIRONDELLE.format(*row) for row in coords.tolist())
+
+
+def _debug_lines(template):
+    """ Patron : marges (rouge), coupes (bleu), zones (pointillés) """
+    width, height = template.global_w, template.global_h
+    x, y = _cells(template)
+    x, y = numpy.unique(x), numpy.unique(y)
+    int_m, dec_m = template.int_margin, template.dec_margin
+
+    def vlines(vals):
+        return "".join(_LINE.format(val, height, val, 0) for val in vals)
+
+    def hlines(vals):
+        return "".join(_LINE.format(0, height - val, width, height - val)
+                       for val in vals)
+
+    def guides(lines, pos, size, delta, middle):
+        # (décalage, type) de chaque trait par rapport au début de la zone
+        offsets = [(-delta - int_m - dec_m, 0.8), (-delta - int_m, None),
+                   (-int_m, 0.2), (0, 0.8), (size, 0.8),
+                   (size + int_m, 0.2), (size + delta + int_m, None),
+                   (size + delta + int_m + dec_m, 0.8)]
+        if middle:
+            offsets.append((size / 2, 0.8))
+        out = ""
+        for offset, ratio in offsets:
+            if ratio is None:
+                out += _color((0, 0, 255)) + lines(pos + offset)
+            else:
+                out += (_color((126, 126, 0)) + _dash(ratio) +
+                        lines(pos + offset) + "[] 0 d\n")
+        return out
+
+    ext = template.ext_margin
+    return (_color((255, 0, 0)) + hlines([ext, height - ext]) +
+            vlines([ext, width - ext]) +
+            guides(vlines, x, template.data_w, template.delta_marj_w, True) +
+            guides(hlines, y, template.data_h, template.delta_marj_h, False))
+
+
+def template_marks(template):
+    """ Content stream (bytes) of the template of template (computed) """
+    stream = f"2 J\n{LINE_WIDTH:.2f} w\n"
+    if template.display_debug:
+        stream += _debug_lines(template)
+    stream += _hirondelles(template)
+    return stream.encode()
@@ -2,10 +2,18 @@
 
 import logging
 import argparse
+import copy
+import glob
+import importlib.util
+import os
+import re
+import shlex
 import textwrap
 import hackimposition
-from hackimposition import ImposerPageTemplate, ImposerAlgo
 from hackimposition import __PRGM__, __VERSION__, __COPYRIGHT__
+from hackimposition.backends import NAMES as BACKENDS, get_backend
+from hackimposition.buffers import STDIO
+from hackimposition.verify import LEVELS as VERIFY_LEVELS
 
 logger = logging.getLogger(hackimposition.__name__)
 
@@ -16,13 +24,14 @@ def _positive_int(text):
     raise argparse.ArgumentTypeError("Argument must be a positive integer.")
 
 
-def _commandline_parser():
-    """Return a command line parser."""
+def _commandline_parser(batch=False):
+    """Return a command line parser (batch: parser of the batch subcommand)."""
     parser = argparse.ArgumentParser(
-        prog=__PRGM__,
+        prog=__PRGM__ + (" batch" if batch else ""),
         description=textwrap.dedent(hackimposition.__doc__),
         formatter_class=argparse.RawTextHelpFormatter,
         epilog=__PRGM__ + " " + __VERSION__ + "   " + __COPYRIGHT__,
+        allow_abbrev=False,
     )
 
     parser.add_argument(
@@ -39,20 +48,73 @@ def _commandline_parser():
         action="store_true"
     )
 
-    parser.add_argument(
-        "infile",
-        metavar="FILE",
-        help="PDF file to process",
-        type=str
-    )
+    if batch:
+        parser.add_argument(
+            "infiles",
+            metavar="FILE",
+            nargs="+",
+            help="PDF files, directories or glob patterns to process",
+            type=str
+        )
 
-    parser.add_argument(
-        "--outfile",
-        "-o",
-        metavar="FILE",
-        help=('Destination file. Default is "-impose" appended to first source file.'),
-        type=str,
-    )
+        parser.add_argument(
+            "--outdir",
+            metavar="DIR",
+            help=('Destination directory. Default is next to each source '
+                  'file, with "-impose" appended.'),
+            type=str,
+        )
+
+        parser.add_argument(
+            "--workers",
+            metavar="N",
+            help="number of files imposed concurrently",
+            type=_positive_int,
+            default=os.cpu_count() or 1,
+        )
+    else:
+        parser.add_argument(
+            "infile",
+            metavar="FILE",
+            help='PDF file to process ("-": standard input)',
+            type=str
+        )
+
+        parser.add_argument(
+            "--outfile",
+            "-o",
+            metavar="FILE",
+            help=('Destination file ("-": standard output). Default is "-impose" '
+                  'appended to first source file\n(standard output for a '
+                  'standard input).'),
+            type=str,
+        )
+
+        parser.add_argument(
+            "--export_plan",
+            metavar="FILE",
+            help="export the placement plan of every page as JSON",
+            type=str,
+        )
+
+        parser.add_argument(
+            "--variant",
+            metavar="[NAME:]OPTIONS",
+            help=('impose the file once more with these layout options '
+                  'added, e.g.\n'
+                  '--variant "sra3:-W 1275.6 -H 907.1 --nb_w 2 --nb_h 2"\n'
+                  '(repeatable ; the input is parsed once, the output is '
+                  'FILE-impose-NAME.pdf)'),
+            action="append",
+        )
+
+        parser.add_argument(
+            "--variant_workers",
+            metavar="N",
+            help="number of variants imposed concurrently",
+            type=_positive_int,
+            default=1,
+        )
 
     parser.add_argument(
         "--last",
@@ -98,6 +160,29 @@ def _commandline_parser():
         type=float
     )
 
+    parser.add_argument(
+        '--nb_w',
+        metavar="N",
+        help="number of cells (double pages) in width",
+        type=_positive_int
+    )
+
+    parser.add_argument(
+        '--nb_h',
+        metavar="N",
+        help="number of cells (double pages) in height",
+        type=_positive_int
+    )
+
+    parser.add_argument(
+        '--method',
+        metavar="METHOD",
+        help=('page order: "natural" (nested double pages, default), "fold" '
+              '(folded signature) or a fold sequence such as "<v>"\n'
+              '(< > : left/right half over the other, ^ v : bottom/top half)'),
+        type=str
+    )
+
     parser.add_argument(
         '--dec_margin',
         '-d',
@@ -125,29 +210,375 @@ def _commandline_parser():
         help="draw the pattern in the template"
     )
 
+    parser.add_argument(
+        '--stream',
+        action="store_true",
+        help="write each signature as soon as it is imposed (bounded memory)"
+    )
+
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        metavar="N",
+        help="number of processes imposing signatures (implies --stream)",
+        type=_positive_int,
+        default=1,
+    )
+
+    parser.add_argument(
+        '--pipeline',
+        action="store_true",
+        help=("read the input, impose and write the output concurrently on "
+              "threads\n(implies --stream)")
+    )
+
+    parser.add_argument(
+        '--chunk',
+        metavar="N",
+        help=("write the sheets in self-contained files of N signatures\n"
+              "(FILE-impose-0001.pdf...) as soon as they are imposed, listed "
+              "in order\nin FILE-impose-manifest.json (implies --stream)"),
+        type=_positive_int,
+    )
+
+    parser.add_argument(
+        '--no_dedup',
+        action="store_true",
+        help="do not merge identical fonts and images of the input pages"
+    )
+
+    parser.add_argument(
+        '--verify',
+        choices=VERIFY_LEVELS,
+        default="fast",
+        help=("check of the written file: none, fast (xref, page count and "
+              "size) or full (re-parse)")
+    )
+
+    parser.add_argument(
+        '--compress',
+        action="store_true",
+        help="Flate compress the sheet contents and uncompressed input streams"
+    )
+
+    parser.add_argument(
+        '--object_streams',
+        action="store_true",
+        help="pack objects in compressed object streams, xref stream (PDF 1.5)"
+    )
+
+    parser.add_argument(
+        '--linearize',
+        action="store_true",
+        help="linearize the output for fast web view (needs pikepdf)"
+    )
+
+    parser.add_argument(
+        '--plan_only',
+        action="store_true",
+        help=("do not impose: write the sheet count, scale, sheet of every "
+              "page and\npaper waste as JSON (stdout or --outfile ; one line "
+              "per file in batch)")
+    )
+
+    parser.add_argument(
+        '--optimize',
+        choices=("scale", "impressions"),
+        help=("choose the sheet (--stock), its orientation and the grid: "
+              "largest pages\n(scale, up to 1) or fewest impressions "
+              "(impressions, see --min_scale)")
+    )
+
+    parser.add_argument(
+        '--stock',
+        metavar="NAME[,NAME...]",
+        help="sheets tried by --optimize (default A4,A3,SRA3,A2,SRA2,B2,A1,B1)",
+        type=str
+    )
+
+    parser.add_argument(
+        '--min_scale',
+        metavar="R+",
+        help="smallest scale accepted by --optimize (default 1 for impressions)",
+        type=float
+    )
+
+    parser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default=BACKENDS[0],
+        help=("PDF engine: pypdf2 (default) or pikepdf (faster, needs pikepdf; "
+              "\nno --stream, --jobs, --incremental or --pipeline)")
+    )
+
+    parser.add_argument(
+        '--profile',
+        metavar="FILE",
+        help="write time and memory used by each stage as JSON",
+        type=str
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        metavar="DIR",
+        help="directory where generated templates are kept between runs",
+        type=str
+    )
+
+    parser.add_argument(
+        '--incremental',
+        action="store_true",
+        help=("keep the imposed sheets in --cache_dir and only re-impose the "
+              "sheets\nwhose input pages changed (implies --stream)")
+    )
+
+    parser.add_argument(
+        '--cache_size',
+        metavar="MB",
+        help="size of the sheet cache of --incremental (default 1024)",
+        type=_positive_int,
+        default=1024,
+    )
+
     return parser
 
 
-def process_args(argv):
-    """ process args """
+def _default_outfile(infile, outdir=None):
+    if infile == STDIO:
+        return STDIO
+    outfile = "{}-impose.pdf".format(".".join(infile.split(".")[:-1]))
+    return outfile if outdir is None else os.path.join(
+        outdir, os.path.basename(outfile))
 
-    opts = _commandline_parser().parse_args(argv)
 
-    logger.setLevel(logging.DEBUG if opts.verbose else logging.INFO)
+def _is_output(filename, stems):
+    """
+    Sortie d'une imposition de l'un des fichiers stems (STEM-impose.pdf,
+    variantes STEM-impose-NAME.pdf, parties STEM-impose-NNNN.pdf et leur
+    STEM-impose-manifest.json)
+    """
+    name = os.path.basename(filename)
+    return any(re.fullmatch(rf"{re.escape(stem)}-impose"
+                            r"(-[^/]+\.pdf|\.pdf|-manifest\.json)", name)
+               for stem in stems)
+
+
+def _expand_infiles(patterns):
+    """
+    FILE | DIR | GLOB --> liste de fichiers
+    Les sorties d'une imposition précédente de l'un de ces fichiers ne sont
+    pas reprises d'un répertoire ou d'un motif (seulement nommées
+    explicitement)
+    """
+    expanded = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            expanded.append(
+                (sorted(glob.glob(os.path.join(pattern, "*.pdf"))), True))
+        elif glob.has_magic(pattern):
+            expanded.append((sorted(glob.glob(pattern)), True))
+        else:
+            expanded.append(([pattern], False))
+    stems = {".".join(os.path.basename(name).split(".")[:-1])
+             for names, _ in expanded for name in names}
+    return [name for names, matched in expanded for name in names
+            if not (matched and _is_output(name, stems))]
+
+
+def _process_opts(opts, verbosity=True):
+    """ opts --> (template, algo) """
+    if verbosity:
+        logger.setLevel(logging.DEBUG if opts.verbose else logging.INFO)
 
     # create template
-    template = ImposerPageTemplate()
+    template = hackimposition.ImposerPageTemplate()
     for key, val in opts.__dict__.items():
         if val is not None and key in template.__dict__.keys():
             logger.debug(f"\tSet {key}: {val}")
             template.__dict__[key] = val
 
+    # template cache
+    if opts.cache_dir:
+        hackimposition.TEMPLATE_CACHE.cache_dir = opts.cache_dir
+
     # creat algo
-    algo = ImposerAlgo(2, 2)
+    try:
+        algo = hackimposition.ImposerAlgo(template.nb_w, template.nb_h, opts.method)
+        backend = get_backend(opts.backend)
+    except ValueError as ex:
+        raise SystemExit(f"{__PRGM__}: error: {ex}") from ex
+    if not backend.streaming and (opts.stream or opts.jobs > 1 or
+                                  opts.incremental or opts.pipeline):
+        raise SystemExit(f"{__PRGM__}: error: backend {backend.name} does not "
+                         "support --stream, --jobs, --incremental or "
+                         "--pipeline")
+    if opts.chunk and (opts.linearize or opts.incremental or
+                       not backend.streaming):
+        raise SystemExit(f"{__PRGM__}: error: --chunk is not supported with "
+                         "--linearize, --incremental or the pikepdf backend")
+    if opts.linearize and importlib.util.find_spec("pikepdf") is None:
+        raise SystemExit(f"{__PRGM__}: error: --linearize needs pikepdf "
+                         "(pip install pikepdf)")
+
+    return (template, algo)
+
+
+def _sheet_cache(opts):
+    """ SheetCache de --incremental (dans --cache_dir) """
+    if not opts.incremental:
+        return None
+    if not opts.cache_dir:
+        raise SystemExit(f"{__PRGM__}: error: --incremental needs --cache_dir")
+    return hackimposition.SheetCache(os.path.join(opts.cache_dir, "sheets"),
+                                     opts.cache_size * 2**20)
+
+
+def _optimizer(opts, template):
+    """ Options de --optimize (quote) ; None sans --optimize """
+    if not opts.optimize:
+        return None
+    from hackimposition.layout import LayoutOptimizer  # pylint: disable=import-outside-toplevel
+    try:
+        optimizer = LayoutOptimizer(
+            template, opts.stock.split(",") if opts.stock else None,
+            method=opts.method)
+    except ValueError as ex:
+        raise SystemExit(f"{__PRGM__}: error: {ex}") from ex
+    return {'optimizer': optimizer, 'objective': opts.optimize,
+            'min_scale': opts.min_scale}
+
+
+def _variants(parser, opts, outfile):
+    """ --variant --> [(template, algo, outfile)...] """
+    if opts.export_plan or opts.profile:
+        parser.error("--export_plan and --profile are not supported with "
+                     "--variant")
+    if outfile == STDIO:
+        parser.error("--variant needs an output file name")
+    variants, root = [], outfile[:-4] if outfile.endswith(".pdf") else outfile
+    template_keys = vars(hackimposition.ImposerPageTemplate())
+    for index, spec in enumerate(opts.variant, 1):
+        # le nom s'arrête au premier ":" (les options peuvent en contenir)
+        name, sep, args = spec.partition(":")
+        if not sep:
+            name, args = "", name
+        # options communes, complétées par celles de la variante
+        variant_opts = parser.parse_args([opts.infile] + shlex.split(args),
+                                         namespace=copy.copy(opts))
+        # seules les options de mise en page (template, algo) s'appliquent
+        # à une variante : les autres seraient ignorées
+        ignored = sorted(key for key, val in vars(variant_opts).items()
+                         if val != getattr(opts, key) and key != "method"
+                         and key not in template_keys)
+        if ignored:
+            parser.error(f"--variant {name or index}: only layout options "
+                         f"are allowed, not --{', --'.join(ignored)}")
+        template, algo = _process_opts(variant_opts, verbosity=False)
+        variants.append((template, algo, f"{root}-{name or index}.pdf"))
+    return variants
+
+
+def process_args(argv, verbosity=True):
+    """
+    process args (verbosity: set the log level from --verbose)
+    With --variant, options['variants'] lists the variants (impose_variants)
+    With --plan_only, options are those of quote() and outfile may be None
+    """
+
+    parser = _commandline_parser()
+    opts = parser.parse_args(argv)
+    template, algo = _process_opts(opts, verbosity)
 
     # filenames
     infile = opts.infile
-    outfile = opts.outfile if opts.outfile else (
-        "{}-impose.pdf".format(".".join(infile.split(".")[:-1])))
+    if opts.variant and (opts.plan_only or opts.optimize):
+        parser.error("--plan_only and --optimize are not supported with "
+                     "--variant")
+    if opts.plan_only:
+        # JSON sur la sortie standard par défaut
+        return (template, algo, infile, opts.outfile,
+                {'plan_only': True, **(_optimizer(opts, template) or {})})
+    outfile = opts.outfile if opts.outfile else _default_outfile(infile)
+    if opts.chunk and outfile == STDIO:
+        parser.error("--chunk needs an output file name")
+    # execution options
+    options = {'stream': opts.stream, 'jobs': opts.jobs,
+               'plan_file': opts.export_plan, 'profile_file': opts.profile,
+               'verify': opts.verify, 'dedup': not opts.no_dedup,
+               'sheet_cache': _sheet_cache(opts), 'backend': opts.backend,
+               'compress': opts.compress,
+               'object_streams': opts.object_streams,
+               'linearize': opts.linearize, 'pipeline': opts.pipeline,
+               'chunk': opts.chunk, 'optimize': _optimizer(opts, template)}
+    if opts.variant:
+        options.update(variants=_variants(parser, opts, outfile),
+                       workers=opts.variant_workers)
+
+    return (template, algo, infile, outfile, options)
+
+
+def process_batch_args(argv):
+    """ process args of the batch subcommand """
+
+    parser = _commandline_parser(batch=True)
+    opts = parser.parse_args(argv)
+    template, algo = _process_opts(opts)
+    if opts.plan_only:
+        return (template, algo, _expand_infiles(opts.infiles),
+                {'plan_only': True, **(_optimizer(opts, template) or {})})
+    if opts.optimize:
+        parser.error("--optimize needs --plan_only in batch (one template "
+                     "for all the files)")
+
+    # filenames
+    if opts.outdir:
+        os.makedirs(opts.outdir, exist_ok=True)
+    files = [(infile, _default_outfile(infile, opts.outdir))
+             for infile in _expand_infiles(opts.infiles)]
+
+    # execution options
+    options = {'workers': opts.workers, 'stream': opts.stream,
+               'jobs': opts.jobs, 'verify': opts.verify,
+               'dedup': not opts.no_dedup, 'sheet_cache': _sheet_cache(opts),
+               'backend': opts.backend, 'compress': opts.compress,
+               'object_streams': opts.object_streams,
+               'linearize': opts.linearize, 'pipeline': opts.pipeline,
+               'chunk': opts.chunk}
+
+    return (template, algo, files, options)
+
+
+def process_serve_args(argv):
+    """ process args of the serve subcommand """
+    from hackimposition import server  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog=__PRGM__ + " serve",
+        description=textwrap.dedent(server.__doc__),
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog=__PRGM__ + " " + __VERSION__ + "   " + __COPYRIGHT__,
+        allow_abbrev=False,
+    )
+    parser.add_argument("-v", "--verbose", help="Verbose mode.",
+                        action="store_true")
+    parser.add_argument("--host", help="listen address (default 127.0.0.1)",
+                        default="127.0.0.1")
+    parser.add_argument("--port", help="listen port (default 8000)",
+                        type=int, default=8000)
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix socket instead of host:port")
+    parser.add_argument("--workers", metavar="N", type=_positive_int,
+                        default=os.cpu_count() or 1,
+                        help="number of requests imposed concurrently")
+    parser.add_argument("--queue", metavar="N", type=int, default=16,
+                        help="requests waiting for a worker before 503")
+    parser.add_argument("--max_size", metavar="MB", type=_positive_int,
+                        default=256, help="maximum input size")
+    parser.add_argument("--cache_dir", metavar="DIR", type=str,
+                        help="directory where generated templates are kept")
+    opts = parser.parse_args(argv)
+    logger.setLevel(logging.DEBUG if opts.verbose else logging.INFO)
 
-    return (template, algo, infile, outfile)
+    return {'host': opts.host, 'port': opts.port, 'socket_path': opts.socket,
+            'workers': opts.workers, 'queue': max(0, opts.queue),
+            'max_size': opts.max_size * 2**20, 'cache_dir': opts.cache_dir}
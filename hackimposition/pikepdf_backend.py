@@ -0,0 +1,153 @@
+"""
+PDF backend based on pikepdf (qpdf)
+
+The input pages are turned into Form XObjects and copied by qpdf : objects
+shared by several pages (fonts, images) are copied once, but identical
+objects are not merged by content (no dedup) and the output is written at
+the end only (no --stream, --jobs, --incremental
+or --pipeline).
+"""
+
+from collections import Counter
+import logging
+import time
+import zlib
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+from hackimposition.buffers import MemoryReader, writable
+from hackimposition.imposition import (
+    _PAGE_XOBJECT, _TEMPLATE_XOBJECT, _placement)
+from hackimposition.profiling import NULL_PROFILER
+
+logger = logging.getLogger(__name__)
+
+
+def _shared_contents(pages):
+    """ Nombre de pages par flux de contenu (objgen) """
+    return Counter(page.obj.Contents.objgen for page in pages
+                   if isinstance(page.obj.get("/Contents"), pikepdf.Stream))
+
+
+def _form_xobject(page, shared):
+    """
+    Page --> Form XObject
+    Un flux de contenu propre à la page devient lui-même le Form XObject (ses
+    données encodées sont recopiées telles quelles ; le PDF d'entrée n'est
+    jamais écrit). Sinon (plusieurs flux, ou flux partagé avec d'autres pages
+    selon shared, voir _shared_contents), qpdf crée un nouveau flux.
+    """
+    contents = page.obj.get("/Contents")
+    if not isinstance(contents, pikepdf.Stream) or \
+            shared[contents.objgen] > 1:
+        return page.as_form_xobject(handle_transformations=False)
+    contents.Type = pikepdf.Name.XObject
+    contents.Subtype = pikepdf.Name.Form
+    contents.BBox = page.mediabox
+    contents.Resources = page.obj.get("/Resources", pikepdf.Dictionary())
+    return contents
+
+
+class PikepdfBackend:
+    """ Backend qpdf (voir backends) """
+
+    name = "pikepdf"
+    streaming = False
+
+    def __init__(self):
+        if pikepdf is None:
+            raise ValueError("The pikepdf backend needs pikepdf "
+                             "(pip install pikepdf)")
+
+    @staticmethod
+    def read(filename):
+        """ filename (ou objet bytes-like) --> (pdf, largeur, hauteur, pages) """
+        pdf = pikepdf.open(filename if isinstance(filename, str)
+                           else MemoryReader(filename))
+        llx, lly, urx, ury = (float(val) for val in pdf.pages[0].mediabox)
+        nb_pages = len(pdf.pages)
+        for titre, elem in pdf.docinfo.items():
+            logger.debug(f"\t{titre}:{elem}")
+        logger.debug(f"\tnb_pages: {nb_pages}")
+        logger.debug(f"\tWidth:{urx - llx} height:{ury - lly}")
+        return (pdf, urx - llx, ury - lly, nb_pages)
+
+    @staticmethod
+    def impose(plan, nb_sheets, template, in_pdf, marks, *,
+               profiler=NULL_PROFILER, dedup=True):
+        # pylint: disable=too-many-arguments, too-many-locals, unused-argument
+        """ Impose le plan sur nb_sheets faces ; retourne le pikepdf.Pdf """
+        out_pdf = pikepdf.Pdf.new()
+        # Les traits de coupe sont stockés une seule fois
+        template_form = pikepdf.Stream(out_pdf, b"")
+        template_form.write(zlib.compress(marks), filter=pikepdf.Name.FlateDecode)
+        template_form.Type = pikepdf.Name.XObject
+        template_form.Subtype = pikepdf.Name.Form
+        template_form.BBox = [0, 0, template.global_w, template.global_h]
+        template_form.Resources = pikepdf.Dictionary()
+        template_form = out_pdf.make_indirect(template_form)
+
+        # toutes les faces, y compris un dernier verso vide
+        sheets, xobjects, contents = [], [], []
+        for _ in range(nb_sheets):
+            sheet = out_pdf.add_blank_page(
+                page_size=(template.global_w, template.global_h))
+            sheet.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(
+                {_TEMPLATE_XOBJECT: template_form}))
+            sheets.append(sheet)
+            xobjects.append(sheet.Resources.XObject)
+            contents.append([f"q {_TEMPLATE_XOBJECT} Do Q"])
+
+        in_pages = list(in_pdf.pages)     # pages[i] parcourt l'arbre
+        shared = _shared_contents(in_pages)
+        for i, ipage, x, y, rotate, pos in plan.tolist():
+            start = time.perf_counter()
+            form = out_pdf.copy_foreign(_form_xobject(in_pages[i], shared))
+            name = _PAGE_XOBJECT.format(i)
+            xobjects[ipage][name] = form
+            contents[ipage].append(_placement(name, pos))
+            profiler.page(i, time.perf_counter() - start)
+            logger.debug(f"\t[{i}/{len(plan)}]" +
+                         f"({i})->(page:{ipage}, x:{x}, y:{y}, r:{rotate})")
+
+        for sheet, content in zip(sheets, contents):
+            sheet.Contents = out_pdf.make_stream("".join(content).encode())
+        return out_pdf
+
+    @staticmethod
+    def write(out_pdf, outfile, infos, *, compress=False,
+              object_streams=False):
+        # pylint: disable=unused-argument
+        """
+        Ecrit le pikepdf.Pdf de sortie dans outfile (nom ou fichier)
+        Les flux générés sont toujours compressés par qpdf (compress)
+        """
+        for key, val in infos.items():
+            out_pdf.docinfo[key] = val
+        # flux recopiés sans décodage
+        with writable(outfile) as file:
+            out_pdf.save(file, compress_streams=True,
+                         stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                         object_stream_mode=pikepdf.ObjectStreamMode.generate
+                         if object_streams else
+                         pikepdf.ObjectStreamMode.disable)
+        out_pdf.close()
+
+
+def linearize(filename, object_streams=False, outfile=None):
+    """
+    Réécrit filename linéarisé (fast web view), flux recopiés sans décodage
+    object_streams : qpdf regroupe à nouveau les objets (la linéarisation
+    impose l'ordre des objets)
+    outfile : fichier écrit à la place de filename (filename peut alors être
+    un objet bytes-like)
+    """
+    if pikepdf is None:
+        raise ValueError("Linearization needs pikepdf (pip install pikepdf)")
+    source = filename if isinstance(filename, str) else MemoryReader(filename)
+    with pikepdf.open(source, allow_overwriting_input=outfile is None) as pdf:
+        pdf.save(filename if outfile is None else outfile, linearize=True,
+                 stream_decode_level=pikepdf.StreamDecodeLevel.none,
+                 object_stream_mode=pikepdf.ObjectStreamMode.generate
+                 if object_streams else pikepdf.ObjectStreamMode.disable)
@@ -0,0 +1,209 @@
+"""
+Pipelined imposition (--pipeline) : the stages run concurrently on threads,
+connected by bounded queues
+
+    fetch    : parse the input pages of the next signatures and every object
+               they reference (reads of the input file)
+    assemble : place the pages on the sheets and serialize them
+    write    : compression (StreamingPdfWriter thread pool) and writes of
+               the output file
+
+The stages share the GIL : the gain comes from the I/O waits (network
+storage, cold disk cache) hidden behind the computation of the other stages.
+The fetch stage asks the kernel to read ahead (madvise) the objects it is
+about to parse, so that the reads do not block the other threads.
+"""
+
+from bisect import bisect_right
+from collections import Counter
+import mmap
+import queue
+import threading
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+DEPTH = 4                       # signatures lues d'avance
+_CHUNK = 2**16                  # taille des écritures du thread d'écriture
+_DONE = object()
+
+
+def prefetch(func, items, depth=DEPTH):
+    """
+    Itère sur func(item) pour chaque item ; les résultats sont calculés
+    d'avance par un thread, au plus depth en attente. Une exception levée
+    par func est relancée dans l'appelant.
+    """
+    results = queue.Queue(depth)
+    stop = threading.Event()
+
+    def _put(value):
+        while not stop.is_set():
+            try:
+                results.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run():
+        try:
+            for item in items:
+                if not _put((func(item), None)):
+                    return
+        except BaseException as ex:  # pylint: disable=broad-except
+            _put((None, ex))
+            return
+        _put((_DONE, None))
+
+    thread = threading.Thread(target=_run, name="hackimposition-fetch",
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            value, error = results.get()
+            if error is not None:
+                raise error
+            if value is _DONE:
+                return
+            yield value
+    finally:
+        stop.set()
+        thread.join()
+
+
+class SharedReader:
+    """
+    PdfFileReader utilisé par plusieurs threads : getObject est protégé par
+    un verrou, et les objets résolus d'avance restent en cache tant qu'une
+    signature en cours les utilise (release())
+    """
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.lock = threading.RLock()
+        self._users = Counter()         # (gen, idnum) --> signatures en cours
+        self._extents = {}              # (gen, idnum) --> (début, fin)
+        self._madvise = None
+        if isinstance(pdf.stream, mmap.mmap) and \
+                hasattr(mmap, "MADV_WILLNEED"):
+            self._madvise = pdf.stream.madvise
+            offsets = sorted(offset for objects in pdf.xref.values()
+                             for offset in objects.values())
+            offsets.append(len(pdf.stream))
+            for gen, objects in pdf.xref.items():
+                for idnum, offset in objects.items():
+                    self._extents[(gen, idnum)] = (
+                        offset, offsets[bisect_right(offsets, offset)])
+        get_object = pdf.getObject
+
+        def _get_object(ref):
+            with self.lock:
+                return get_object(ref)
+        pdf.getObject = _get_object
+
+    def _will_need(self, ref):
+        """ Lecture anticipée (asynchrone) de l'objet ref """
+        extent = self._extents.get((ref.generation, ref.idnum))
+        if extent is not None:
+            start = extent[0] - extent[0] % mmap.PAGESIZE
+            self._madvise(mmap.MADV_WILLNEED, start, extent[1] - start)
+
+    def resolve(self, objects):
+        """
+        Lit tous les objets atteints depuis objects ; retourne leurs clés,
+        à rendre avec release()
+        """
+        keys, todo = set(), list(objects)
+        while todo:
+            obj = todo.pop()
+            if isinstance(obj, IndirectObject):
+                key = (obj.generation, obj.idnum)
+                if obj.pdf is not self.pdf or key in keys:
+                    continue
+                keys.add(key)
+                with self.lock:
+                    self._users[key] += 1
+                obj = obj.getObject()
+            if isinstance(obj, DictionaryObject):
+                children = list(obj.values())
+            elif isinstance(obj, ArrayObject):
+                children = list(obj)
+            else:
+                continue
+            for child in children:
+                if isinstance(child, IndirectObject) and \
+                        child.pdf is self.pdf:
+                    self._will_need(child)
+            todo.extend(children)
+        return keys
+
+    def release(self, keys):
+        """ Oublie les objets de keys qu'aucune signature en cours n'utilise """
+        with self.lock:
+            for key in keys:
+                self._users[key] -= 1
+                if self._users[key] <= 0:
+                    del self._users[key]
+                    self.pdf.resolvedObjects.pop(key, None)
+
+    def close(self):
+        """ Rend au lecteur son getObject """
+        del self.pdf.getObject
+
+
+class BackgroundWriter:
+    """
+    Fichier de sortie écrit par un thread : write() regroupe les données et
+    les met en file (bornée) ; tell() n'attend pas l'écriture
+    """
+
+    def __init__(self, file, depth=64):
+        self.file = file
+        self._pos = file.tell()
+        self._buf = bytearray()
+        self._chunks = queue.Queue(depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run,
+                                        name="hackimposition-write",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            if self._error is None:
+                try:
+                    self.file.write(chunk)
+                except BaseException as ex:  # pylint: disable=broad-except
+                    # la file continue d'être vidée : write() ne bloque pas
+                    self._error = ex
+
+    def _flush(self):
+        if self._error is not None:
+            raise self._error
+        if self._buf:
+            self._chunks.put(bytes(self._buf))
+            self._buf.clear()
+
+    def write(self, data):
+        """ Ajoute data à la fin du fichier """
+        self._buf += data
+        self._pos += len(data)
+        if len(self._buf) >= _CHUNK:
+            self._flush()
+        return len(data)
+
+    def tell(self):
+        """ Position de fin des données écrites """
+        return self._pos
+
+    def close(self):
+        """ Attend la fin des écritures (le fichier reste ouvert) """
+        try:
+            self._flush()
+        finally:
+            self._chunks.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
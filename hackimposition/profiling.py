@@ -0,0 +1,116 @@
+""" Per-stage timing and memory instrumentation """
+
+from contextlib import contextmanager
+import json
+import logging
+import time
+import tracemalloc
+
+try:
+    import resource             # peak RSS (POSIX only)
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def _maxrss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class NullProfiler:
+    """ Profiler qui ne mesure rien (par défaut) """
+
+    @contextmanager
+    def stage(self, name):  # pylint: disable=unused-argument
+        """ no-op """
+        yield
+
+    def page(self, index, seconds):
+        """ no-op """
+
+    def close(self):
+        """ no-op """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Profiler(NullProfiler):
+    """
+    Mesure de chaque étape : temps réel, temps CPU, pic d'allocation Python
+    (tracemalloc) et pic de RSS du processus ; temps de placement par page.
+    hook(record) est appelé à la fin de chaque étape.
+    close() (ou la sortie du bloc with) arrête tracemalloc s'il a été démarré
+    par ce Profiler.
+    """
+
+    def __init__(self, hook=None, trace_memory=True):
+        self.hook = hook
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.pages = []
+        self.infos = {}
+        self._started = trace_memory and not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """ Mesure le bloc comme l'étape name """
+        if self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "name": name,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "peak_alloc_bytes": (tracemalloc.get_traced_memory()[1]
+                                     if self.trace_memory else None),
+                "maxrss_kb": _maxrss_kb(),
+            }
+            self.stages.append(record)
+            logger.debug(f"\t{name}: {record['wall_s']:.3f}s wall, "
+                         f"{record['cpu_s']:.3f}s cpu")
+            if self.hook is not None:
+                self.hook(record)
+
+    def page(self, index, seconds):
+        """ Temps de placement de la page index """
+        self.pages.append({"index": index, "seconds": seconds})
+
+    def report(self):
+        """ Résultats (dict sérialisable en JSON) """
+        return {
+            **self.infos,
+            "stages": self.stages,
+            "total": {
+                "wall_s": sum(stage["wall_s"] for stage in self.stages),
+                "cpu_s": sum(stage["cpu_s"] for stage in self.stages),
+                "maxrss_kb": _maxrss_kb(),
+            },
+            "pages": self.pages,
+        }
+
+    def dump(self, filename):
+        """ Ecrit report() en JSON dans filename """
+        with open(filename, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+
+    def close(self):
+        """ Arrête tracemalloc s'il a été démarré par ce Profiler """
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+            self.trace_memory = False
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,154 @@
+"""
+Plan only (--plan_only) : sheet count, scale, page to sheet mapping and paper
+waste of an imposition, without writing it
+
+Only the trailer, the xref and the page tree of the input are read (page
+count, MediaBox of the first page) : no template, no marks, no page merge.
+With a layout.LayoutOptimizer, the layout of each file is chosen first.
+"""
+
+import copy
+import json
+import mmap
+import re
+import time
+import numpy
+from hackimposition.buffers import read_source, searchable, source_name
+from hackimposition.imposition import ImposerAlgo, _read_pdf
+from hackimposition.layout import apply
+from hackimposition.verify import (
+    _NUMBER, _REF, VerifyError, _XrefFile, _search)
+
+_MEDIABOX = re.compile(rb"/MediaBox\s*(?:" + _REF + rb"|\[\s*" +
+                       rb"\s+".join([_NUMBER] * 4) + rb"\s*\])")
+_KID = re.compile(rb"/Kids\s*\[\s*" + _REF)
+
+
+def _media_box(xref, node):
+    """ (largeur, hauteur) de la /MediaBox de node, None si absente """
+    box = _MEDIABOX.search(node)
+    if box is None:
+        return None
+    if box.group(1) is not None:
+        box = re.match(rb"\s*\[\s*" + rb"\s+".join([_NUMBER] * 4),
+                       xref.object(int(box.group(1))).split(b"obj", 1)[-1])
+        if box is None:
+            raise VerifyError("bad indirect /MediaBox")
+        llx, lly, urx, ury = (float(val) for val in box.groups())
+    else:
+        llx, lly, urx, ury = (float(val) for val in box.groups()[2:])
+    return (urx - llx, ury - lly)
+
+
+def page_info(data):
+    """
+    (nb_pages, width, height) of a PDF (bytes, bytearray or mmap), size of
+    the first page, read from the trailer and the page tree only
+    Raise VerifyError if they cannot be read this way.
+    """
+    xref = _XrefFile(data)
+    num = xref.ref(xref.object(xref.ref(xref.trailer, b"/Root")), b"/Pages")
+    node = xref.object(num)
+    nb_pages = int(_search(rb"/Count (\d+)", node, "/Count").group(1))
+    # première feuille ; la /MediaBox peut être héritée d'un noeud parent
+    size = _media_box(xref, node)
+    for _ in range(64):
+        kid = _KID.search(node)
+        if kid is None:
+            break
+        node = xref.object(int(kid.group(1)))
+        size = _media_box(xref, node) or size
+    if size is None:
+        raise VerifyError("/MediaBox of page 0 not found")
+    return (nb_pages, *size)
+
+
+def _read_info(infile):
+    """ page_info de infile ; relecture par PyPDF2 en cas d'échec """
+    source = read_source(infile)
+    try:
+        if not isinstance(source, str):
+            return page_info(searchable(source))
+        with open(source, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return page_info(data)
+    except VerifyError:
+        _, width, height, nb_pages = _read_pdf(source)
+        return (nb_pages, width, height)
+
+
+def _best_layout(info, optimizer, objective, min_scale):
+    nb_pages, width, height = info
+    layouts = optimizer.best(width, height, nb_pages, objective, min_scale)
+    if not layouts:
+        raise ValueError(f"no layout fits {width}x{height} pages" +
+                         (f" at scale {min_scale}" if min_scale else ""))
+    return layouts[0]
+
+
+def best_layout(infile, optimizer, objective="scale", min_scale=None):
+    """ Best layout for infile (see LayoutOptimizer.best) ; ValueError if none """
+    return _best_layout(_read_info(infile), optimizer, objective, min_scale)
+
+
+def quote(template, imposer, infile, optimizer=None, objective="scale",
+          min_scale=None):
+    # pylint: disable=too-many-arguments
+    """
+    Imposition figures of infile (see impose()), as a JSON serializable dict :
+    sheet count, scale, output side of every input page ("sides" : side k is
+    the recto of sheet k // 2 when k is even, its verso when k is odd), blank
+    page slots and paper waste. Nothing is written.
+    optimizer: layout.LayoutOptimizer, impose with the best layout for
+    objective and min_scale instead of the one of template ("layout")
+    """
+    info = nb_pages, width, height = _read_info(infile)
+    layout = None
+    if optimizer is not None:
+        layout = _best_layout(info, optimizer, objective, min_scale)
+        template = apply(layout, copy.copy(template))
+        imposer = ImposerAlgo(template.nb_w, template.nb_h, imposer.method)
+    template.compute_internals(width, height, warn=False)
+    imposer.compute_internals(nb_pages)
+    page_sides = imposer.compute_index_pos_array(numpy.arange(nb_pages))[0]
+    sides = imposer.nb_out_pages
+    area = sides * template.global_w * template.global_h
+    used = nb_pages * template.data_w / 2 * template.data_h
+    result = {
+        "infile": source_name(infile),
+        "nb_in_pages": nb_pages,
+        "page_width": width,
+        "page_height": height,
+        "nb_out_pages": sides,
+        "nb_sheets": sides // 2,
+        "sheet_width": template.global_w,
+        "sheet_height": template.global_h,
+        "scale": template.scale,
+        "blank_pages": sides * imposer.nb_cell - nb_pages,
+        "paper_used": used / area if area else 0.,
+        "paper_waste": 1. - used / area if area else 0.,
+        "sides": page_sides.tolist(),
+    }
+    if layout is not None:
+        result["layout"] = layout
+    return result
+
+
+def quote_many(template, imposer, infiles, file=None, **options):
+    """
+    quote() of every file ; with file, write one JSON line per file as soon
+    as it is computed. Errors are reported in the "error" field.
+    options: see quote(). Return the list of the dicts.
+    """
+    results = []
+    for infile in infiles:
+        start = time.perf_counter()
+        try:
+            result = quote(template, imposer, infile, **options)
+        except Exception as ex:  # pylint: disable=broad-except
+            result = {"infile": source_name(infile), "error": f"{type(ex).__name__}: {ex}"}
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+        if file is not None:
+            file.write(json.dumps(result) + "\n")
+    return results
@@ -0,0 +1,377 @@
+"""
+Imposition service : a long-running process keeps the imports, the template
+cache and the fold tables warm between requests.
+
+    POST /impose?nb_w=2&method=fold&stream    body: PDF  -->  imposed PDF
+    GET  /metrics                             queue depth, latency... (JSON)
+    GET  /health
+
+Query parameters are the command line options without the leading "--"
+(a parameter without value is a flag) ; only the options of the layout and
+of the output format are accepted, never a file name of the server.
+Requests are imposed concurrently by a pool of processes ; when the pool and
+the queue are full, new requests are refused with 503 instead of piling up.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import shutil
+import signal
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+import zlib
+
+import hackimposition
+from hackimposition.options import process_args
+
+logger = logging.getLogger(__name__)
+
+# seules options acceptées : aucune ne désigne un fichier du serveur ni ne
+# modifie son état global
+_ALLOWED = {"last", "global_w", "global_h", "int_margin", "ext_margin",
+            "nb_w", "nb_h", "method", "dec_margin", "dec_line_coef",
+            "dec_keep_overflow", "display_debug", "stream", "no_dedup",
+            "verify", "backend", "compress", "object_streams", "linearize",
+            "pipeline", "optimize", "stock", "min_scale"}
+
+
+def _worker_init(cache_dir, level):
+    """ Processus de travail : caches chauds pour toute sa durée de vie """
+    # arrêt géré par serve()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logging.getLogger(hackimposition.__name__).setLevel(level)
+    if cache_dir:
+        hackimposition.TEMPLATE_CACHE.cache_dir = cache_dir
+    template = hackimposition.ImposerPageTemplate()
+    hackimposition.ImposerAlgo(template.nb_w, template.nb_h)
+
+
+def _input_errors():
+    """ Exceptions d'un PDF d'entrée illisible """
+    # pylint: disable=import-outside-toplevel
+    from PyPDF2.utils import PdfReadError
+    errors = (PdfReadError, struct.error, zlib.error)
+    # pikepdf n'est chargé que par son backend
+    pikepdf = sys.modules.get("pikepdf")
+    return errors + (pikepdf.PdfError,) if pikepdf else errors
+
+
+def _worker_impose(template, imposer, infile, outfile, options):
+    """
+    impose() dans un processus de travail ; retourne la durée
+    Un PDF d'entrée illisible lève ValueError (erreur du client).
+    """
+    start = time.perf_counter()
+    try:
+        hackimposition.impose(template, imposer, infile, outfile, **options)
+    except _input_errors() as ex:
+        # sans le chemin du fichier temporaire du serveur
+        message = str(ex).replace(f"{infile}: ", "")
+        raise ValueError(f"invalid input PDF: {message}") from ex
+    return time.perf_counter() - start
+
+
+def _query_argv(query):
+    """ "nb_w=2&stream" --> ["--nb_w=2", "--stream"] """
+    argv = []
+    for key, val in parse_qsl(query, keep_blank_values=True):
+        if key not in _ALLOWED:
+            raise ValueError(f"option {key} is not allowed")
+        # valeur collée : jamais lue comme une autre option
+        argv.append(f"--{key}={val}" if val else f"--{key}")
+    return argv
+
+
+def _check_options(infile, outfile, parsed):
+    """ Les options analysées n'écrivent que outfile (défense en profondeur) """
+    _, _, parsed_in, parsed_out, options = parsed
+    unsafe = [key for key in ("plan_file", "profile_file", "sheet_cache",
+                              "chunk", "variants", "plan_only")
+              if options.get(key)]
+    if parsed_in != infile or parsed_out != outfile or unsafe:
+        raise ValueError(f"option {', '.join(unsafe) or 'file'} is not "
+                         "allowed")
+
+
+def _percentile(values, ratio):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+class ImpositionService:
+    """
+    Etat partagé par les requêtes : pool de processus, file bornée (au plus
+    workers + queue requêtes admises) et métriques
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, workers=1, queue=4, cache_dir=None,
+                 max_size=256 * 2**20):
+        self.workers = workers
+        self.queue = queue
+        self.max_size = max_size
+        self.workdir = tempfile.mkdtemp(prefix="hackimposition-serve-")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        # les étapes de chaque requête ne sont détaillées qu'en mode verbeux
+        level = logging.getLogger(hackimposition.__name__).getEffectiveLevel()
+        self._pool = ProcessPoolExecutor(
+            workers, initializer=_worker_init,
+            initargs=(cache_dir, max(level, logging.WARNING)
+                      if level > logging.DEBUG else level))
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        # invalid : options ou PDF refusés (400), rejected : service plein
+        self._counters = {"in_flight": 0, "completed": 0, "failed": 0,
+                          "invalid": 0, "rejected": 0}
+        self._started = time.time()
+        self._next_id = 0
+
+    def admit(self):
+        """ Réserve une place (sans attendre) ; False si tout est occupé """
+        # pylint: disable=consider-using-with
+        # place rendue par release()
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            return False
+        with self._lock:
+            self._counters["in_flight"] += 1
+            self._next_id += 1
+            return self._next_id
+
+    def release(self, seconds, outcome):
+        """ Libère la place d'une requête terminée (completed, failed...) """
+        with self._lock:
+            self._counters["in_flight"] -= 1
+            self._counters[outcome] += 1
+            if outcome == "completed":
+                self._latencies.append(seconds)
+        self._slots.release()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def impose(self, request_id, query, body, length):
+        """
+        Impose le PDF lu dans body (length octets) avec les options query
+        Retourne le chemin du PDF imposé (à supprimer par l'appelant)
+        Lève ValueError si les options ou le PDF sont invalides.
+        """
+        # pylint: disable=too-many-arguments
+        argv = _query_argv(query)
+        infile = os.path.join(self.workdir, f"{request_id}.pdf")
+        outfile = os.path.join(self.workdir, f"{request_id}-impose.pdf")
+        try:
+            parsed = process_args([infile, "--outfile", outfile] + argv,
+                                  verbosity=False)
+        except SystemExit as ex:
+            raise ValueError(f"invalid options {' '.join(argv)}"
+                             if isinstance(ex.code, int) else ex.code) from ex
+        _check_options(infile, outfile, parsed)
+        template, imposer, *_, options = parsed
+        # les processus du pool ne peuvent pas en créer d'autres
+        options["jobs"] = 1
+
+        with open(infile, "wb") as file:
+            while length > 0:
+                chunk = body.read(min(length, 2**20))
+                if not chunk:
+                    raise ValueError("truncated request body")
+                file.write(chunk)
+                length -= len(chunk)
+        try:
+            self._pool.submit(_worker_impose, template, imposer, infile,
+                              outfile, options).result()
+        except BaseException:
+            if os.path.exists(outfile):
+                os.remove(outfile)
+            raise
+        finally:
+            os.remove(infile)
+        return outfile
+
+    def metrics(self):
+        """ Métriques (dict sérialisable en JSON) """
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+        return {
+            **counters,
+            "workers": self.workers,
+            "queue_size": self.queue,
+            "running": min(counters["in_flight"], self.workers),
+            "queue_depth": max(0, counters["in_flight"] - self.workers),
+            "uptime_s": time.time() - self._started,
+            "latency_s": {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+    def close(self):
+        """ Arrête le pool et supprime les fichiers temporaires """
+        self._pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Requêtes HTTP --> ImpositionService """
+
+    server_version = f"{hackimposition.__PRGM__}/{hackimposition.__VERSION__}"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(f"\t{format % args}")
+
+    def _reply(self, status, body=b"", content_type="text/plain",
+               headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self.close_connection = True
+        self._reply(status, (message + "\n").encode(), headers=headers)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ /metrics, /health """
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self._reply(HTTPStatus.OK, json.dumps(
+                self.server.service.metrics(), indent=1).encode(),
+                "application/json")
+        elif path == "/health":
+            self._reply(HTTPStatus.OK, b"OK\n")
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f"unknown path {path}")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """ /impose """
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path != "/impose":
+            self._error(HTTPStatus.NOT_FOUND, f"unknown path {url.path}")
+            return
+        if "Content-Length" not in self.headers:
+            self._error(HTTPStatus.LENGTH_REQUIRED, "Content-Length required")
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self._error(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+            return
+        if length > service.max_size:
+            self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"input larger than {service.max_size} bytes")
+            return
+        request_id = service.admit()
+        if not request_id:
+            self._error(HTTPStatus.SERVICE_UNAVAILABLE, "busy, retry later",
+                        {"Retry-After": "1"})
+            return
+
+        start, outfile, outcome = time.perf_counter(), None, "failed"
+        try:
+            outfile = service.impose(request_id, url.query, self.rfile, length)
+            outcome = "completed"
+        except ValueError as ex:
+            outcome = "invalid"
+            self._error(HTTPStatus.BAD_REQUEST, str(ex))
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error(f"\trequest {request_id}: {ex}")
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR,
+                        f"{type(ex).__name__}: {ex}")
+        finally:
+            seconds = time.perf_counter() - start
+            service.release(seconds, outcome)
+        if outfile is None:
+            return
+
+        logger.info(f"\trequest {request_id}: {seconds:.2f}s")
+        try:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.path.getsize(outfile)))
+            self.send_header("X-Imposition-Seconds", f"{seconds:.3f}")
+            self.end_headers()
+            with open(outfile, "rb") as file:
+                shutil.copyfileobj(file, self.wfile)
+        finally:
+            os.remove(outfile)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """ ThreadingHTTPServer des requêtes d'une ImpositionService """
+
+    def __init__(self, address, service):
+        super().__init__(address, _Handler)
+        self.service = service
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ _HTTPServer sur une socket Unix """
+
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        super().__init__(path, _Handler)
+        self.service = service
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(host="127.0.0.1", port=8000, socket_path=None, **service_options):
+    """
+    Run the imposition service until interrupted
+    socket_path: listen on this Unix socket instead of host:port
+    service_options: see ImpositionService
+    """
+    service = ImpositionService(**service_options)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, service)
+        address = socket_path
+    else:
+        server = _HTTPServer((host, port), service)
+        address = f"http://{host}:{server.server_address[1]}"
+    signal.signal(signal.SIGTERM, _stop)
+    logger.info(f">>> Serving on {address} (workers={service.workers}, "
+                f"queue={service.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        logger.info(">>> Stopped")
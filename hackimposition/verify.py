@@ -0,0 +1,297 @@
+"""
+Output verification
+
+    none : no check
+    fast : xref offsets, page count and MediaBox, read through mmap from the
+           trailer, the xref tables or streams and the page tree only
+    full : re-parse the whole file with PyPDF2
+"""
+
+import functools
+import logging
+import mmap
+import re
+import zlib
+from hackimposition.buffers import MemoryReader, searchable
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("none", "fast", "full")
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_SUBSECTION = re.compile(rb"(\d+) (\d+)\s*\n")
+_ENTRY = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_REF = rb"(\d+) (\d+) R"
+_OBJ = re.compile(rb"\d+ \d+ obj\s*")
+_NUMBER = rb"([-+]?[\d.]+)"
+
+
+class VerifyError(ValueError):
+    """ The written PDF is not the expected one """
+
+
+def _search(pattern, data, what):
+    match = re.search(pattern, data)
+    if match is None:
+        raise VerifyError(f"{what} not found")
+    return match
+
+
+class _XrefFile:
+    """
+    Accès aux objets d'un PDF via ses tables xref (sans tout analyser)
+    Tables classiques ou flux xref (PDF 1.5), sections chaînées par /Prev
+    (fichiers linéarisés ou mis à jour), objets des flux d'objets.
+    Les entrées ne sont décodées qu'à la demande (entry()).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        tail = data[max(0, len(data) - 1024):]
+        starts = list(_STARTXREF.finditer(tail))
+        if not starts:
+            raise VerifyError("startxref not found")
+        self._sections = []         # (premier, nombre, entrée), récentes d'abord
+        self._objstms = {}          # num --> [(num, texte)...]
+        self.trailer = None
+        pos, seen = int(starts[-1].group(1)), set()
+        while pos is not None and pos not in seen:
+            seen.add(pos)
+            if data[pos:pos + 4] == b"xref":
+                trailer = self._read_table(pos + 4)
+            elif _OBJ.match(data, pos):
+                trailer = self._read_stream(pos)
+            else:
+                raise VerifyError(f"startxref {pos} does not point to an xref")
+            self.trailer = self.trailer or trailer
+            prev = re.search(rb"/Prev (\d+)", trailer)
+            pos = int(prev.group(1)) if prev else None
+
+    def _read_table(self, pos):
+        """ Table classique : entrées de 20 octets, lues à la demande """
+        data = self.data
+
+        def _entry(index, first, start):
+            entry = _ENTRY.match(data, start + 20 * index)
+            if entry is None:
+                raise VerifyError(f"bad xref entry for object {first + index}")
+            return (1, int(entry.group(1)), 0) if entry.group(3) == b"n" \
+                else (0, 0, 0)
+
+        while True:
+            while data[pos:pos + 1] in b" \r\n":
+                pos += 1
+            section = _SUBSECTION.match(data, pos)
+            if section is None:
+                break
+            first, count = int(section.group(1)), int(section.group(2))
+            self._sections.append((first, count, functools.partial(
+                _entry, first=first, start=section.end())))
+            pos = section.end() + 20 * count
+        if data[pos:pos + 7] != b"trailer":
+            raise VerifyError("trailer not found after xref")
+        return data[pos:data.find(b"startxref", pos)]
+
+    def _read_stream(self, pos):
+        """ Flux xref : /W [type champ2 champ3], /Index [premier nombre...] """
+        head, rows = self._stream(pos)
+        if not re.search(rb"/Type\s*/XRef", head):
+            raise VerifyError(f"startxref {pos} does not point to an xref")
+        widths = [int(val) for val in _search(
+            rb"/W\s*\[([\d\s]*)\]", head, "/W").group(1).split()]
+        index = re.search(rb"/Index\s*\[([\d\s]*)\]", head)
+        index = [int(val) for val in index.group(1).split()] if index else \
+            [0, int(_search(rb"/Size (\d+)", head, "/Size").group(1))]
+
+        def _entry(index, row):
+            fields, start = [], (row + index) * sum(widths)
+            for width in widths:
+                fields.append(int.from_bytes(rows[start:start + width], "big"))
+                start += width
+            if not widths[0]:
+                fields[0] = 1
+            return tuple(fields)
+
+        row = 0
+        for first, count in zip(index[::2], index[1::2]):
+            self._sections.append((first, count,
+                                   functools.partial(_entry, row=row)))
+            row += count
+        return head
+
+    def entry(self, num):
+        """ (0, 0, 0) libre, (1, position, 0) ou (2, flux d'objets, index) """
+        for first, count, entry in self._sections:
+            if first <= num < first + count:
+                return entry(num - first)
+        return (0, 0, 0)
+
+    def entries(self):
+        """ {num: entrée} de tous les objets utilisés """
+        entries = {}
+        for first, count, entry in self._sections:
+            for num in range(first, first + count):
+                if num not in entries:
+                    entries[num] = entry(num - first)
+        return {num: val for num, val in entries.items() if val[0]}
+
+    def _stream(self, start):
+        """ (dictionnaire, données décodées) du flux à la position start """
+        end = self.data.find(b"stream", start)
+        head = self.data[start:end]
+        length = _search(rb"/Length\s+" + _REF + rb"|/Length\s+(\d+)",
+                         head, "/Length")
+        if length.group(3) is None:
+            length = int(_OBJ.sub(b"", self.object(int(length.group(1)))))
+        else:
+            length = int(length.group(3))
+        end += 6
+        end += 2 if self.data[end:end + 2] == b"\r\n" else 1
+        stream = self.data[end:end + length]
+        filters = re.findall(rb"/(\w+)", (re.search(
+            rb"/Filter\s*(\[[^\]]*\]|/\w+)", head) or [b"", b""])[1])
+        for name in filters:
+            if name != b"FlateDecode":
+                raise VerifyError(f"unsupported filter {name.decode()}")
+            stream = zlib.decompress(stream)
+        predictor = re.search(rb"/Predictor (\d+)", head)
+        if predictor and int(predictor.group(1)) >= 10:
+            columns = re.search(rb"/Columns (\d+)", head)
+            stream = _png_unpredict(stream, int(columns.group(1))
+                                    if columns else 1)
+        return head, stream
+
+    def check_offsets(self):
+        """ Chaque entrée de l'xref pointe sur 'num 0 obj' """
+        entries = self.entries()
+        for num, (kind, offset, _) in entries.items():
+            header = b"%d 0 obj" % num
+            if kind == 1 and self.data[offset:offset + len(header)] != header:
+                raise VerifyError(f"xref offset {offset} of object {num} "
+                                  "is wrong")
+            if kind == 2 and entries.get(offset, (0,))[0] != 1:
+                raise VerifyError(f"object stream {offset} of object {num} "
+                                  "not in xref")
+        size = int(_search(rb"/Size (\d+)", self.trailer, "/Size").group(1))
+        if size != max(entries, default=0) + 1:
+            raise VerifyError(f"/Size {size} does not match the xref table")
+
+    def _objstm(self, num):
+        """ Objets du flux d'objets num : [(num, texte)...] """
+        if num not in self._objstms:
+            kind, offset, _ = self.entry(num)
+            if kind != 1:
+                raise VerifyError(f"object stream {num} not in xref")
+            head, data = self._stream(offset)
+            first = int(_search(rb"/First (\d+)", head, "/First").group(1))
+            count = int(_search(rb"/N (\d+)", head, "/N").group(1))
+            pairs = [int(val) for val in data[:first].split()][:2 * count]
+            starts = [first + val for val in pairs[1::2]] + [len(data)]
+            self._objstms[num] = [(obj, data[start:end]) for obj, start, end
+                                  in zip(pairs[::2], starts, starts[1:])]
+        return self._objstms[num]
+
+    def object(self, num):
+        """ Texte de l'objet num (dictionnaire, sans flux) """
+        kind, start, index = self.entry(num)
+        if kind == 2:
+            return self._objstm(start)[index][1]
+        if kind != 1:
+            raise VerifyError(f"object {num} not in xref")
+        end = self.data.find(b"endobj", start)
+        stream = self.data.find(b"stream", start, end)
+        return self.data[start:end if stream < 0 else stream]
+
+    def ref(self, data, key):
+        """ Numéro de l'objet référencé par key dans data """
+        return int(_search(re.escape(key) + rb"\s+" + _REF, data, key).group(1))
+
+
+def _png_unpredict(data, columns):
+    """ Prédicteurs PNG (None, Sub, Up) des flux xref """
+    rows, prev = [], bytes(columns)
+    for start in range(0, len(data), columns + 1):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + columns])
+        if kind == 1:
+            for i in range(1, len(row)):
+                row[i] = (row[i] + row[i - 1]) & 0xff
+        elif kind == 2:
+            for i, val in enumerate(prev):
+                row[i] = (row[i] + val) & 0xff
+        elif kind != 0:
+            raise VerifyError(f"unsupported PNG predictor {kind}")
+        rows.append(bytes(row))
+        prev = row
+    return b"".join(rows)
+
+
+def _pages(xref, num):
+    """ Feuilles de l'arbre des pages """
+    node = xref.object(num)
+    kids = _search(rb"/Kids\s*\[([^\]]*)\]", node, "/Kids")
+    pages = []
+    for kid in re.finditer(_REF, kids.group(1)):
+        child = xref.object(int(kid.group(1)))
+        if b"/Kids" in child:
+            pages += _pages(xref, int(kid.group(1)))
+        else:
+            pages.append(child)
+    return pages
+
+
+def verify_fast(data, nb_pages, width, height):
+    """ Vérification structurelle (data : objet bytes-like ou mmap du PDF) """
+    xref = _XrefFile(searchable(data))
+    xref.check_offsets()
+    root = xref.ref(xref.trailer, b"/Root")
+    pages_num = xref.ref(xref.object(root), b"/Pages")
+    count = int(_search(rb"/Count (\d+)", xref.object(pages_num),
+                        "/Count").group(1))
+    pages = _pages(xref, pages_num)
+    if count != nb_pages or len(pages) != nb_pages:
+        raise VerifyError(f"{len(pages)} pages (/Count {count}), "
+                          f"expected {nb_pages}")
+    box = rb"/MediaBox\s*\[\s*" + rb"\s+".join([_NUMBER] * 4) + rb"\s*\]"
+    for index, page in enumerate(pages):
+        llx, lly, urx, ury = (float(val) for val in _search(
+            box, page, f"/MediaBox of page {index}").groups())
+        if abs(urx - llx - width) > 1e-3 or abs(ury - lly - height) > 1e-3:
+            raise VerifyError(f"page {index}: MediaBox {urx - llx}x"
+                              f"{ury - lly}, expected {width}x{height}")
+
+
+def verify_full(filename, nb_pages, width, height):
+    """ Relecture complète avec PyPDF2 (filename : nom ou objet bytes-like) """
+    import PyPDF2  # pylint: disable=import-outside-toplevel
+    pdf = PyPDF2.PdfFileReader(filename if isinstance(filename, str)
+                               else MemoryReader(filename))
+    if pdf.getNumPages() != nb_pages:
+        raise VerifyError(f"{pdf.getNumPages()} pages, expected {nb_pages}")
+    for index in range(nb_pages):
+        box = pdf.getPage(index).mediaBox
+        if abs(float(box.getWidth()) - width) > 1e-3 or \
+                abs(float(box.getHeight()) - height) > 1e-3:
+            raise VerifyError(f"page {index}: MediaBox {box}, "
+                              f"expected {width}x{height}")
+    for titre, elem in pdf.getDocumentInfo().items():
+        logger.debug("\t" + titre + ":" + elem)
+
+
+def verify(filename, level, nb_pages, width, height):
+    """
+    Check filename (file name or bytes-like PDF) at the given level (see
+    LEVELS)
+    """
+    if level == "none":
+        return
+    if level == "full":
+        verify_full(filename, nb_pages, width, height)
+    elif level == "fast" and not isinstance(filename, str):
+        verify_fast(filename, nb_pages, width, height)
+    elif level == "fast":
+        with open(filename, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            verify_fast(data, nb_pages, width, height)
+    else:
+        raise ValueError(f"Unknown verification level {level}")
+    logger.debug(f"\t{nb_pages} pages {width}x{height}: OK ({level})")
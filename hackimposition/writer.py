@@ -0,0 +1,501 @@
+"""
+Streaming PDF writer : objects are written as soon as they are added
+
+Optional compressed output :
+    compress       : streams without filter (sheet contents, uncompressed
+                     input streams) are Flate compressed
+    object_streams : objects other than streams are packed in compressed
+                     object streams, the xref is a compressed xref stream
+                     (PDF 1.5)
+Compression runs on a thread pool (zlib releases the GIL) while the next
+objects are serialized ; the objects are still written in order, the file
+does not depend on the number of threads.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import logging
+import os
+import struct
+import zlib
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+    StreamObject, createStringObject)
+
+logger = logging.getLogger(__name__)
+
+OBJSTM_SIZE = 100               # objets par flux d'objets
+_MAX_DEFERRED = 64              # compressions en cours au plus
+_REF_KINDS = {"local": 2, "out": 2, "ext": 3}   # jeton de référence --> taille
+
+
+def _indirect_contents(writer, page):
+    """ Un flux est toujours un objet indirect : /Contents en référence """
+    contents = page.get("/Contents")
+    if isinstance(contents, StreamObject):
+        page[NameObject("/Contents")] = writer.add_object(contents)
+
+
+class Deflate:
+    """ Données d'un flux à compresser (FlateDecode) au moment de l'écriture """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @staticmethod
+    def tail(compressed):
+        """ Fin du dictionnaire et flux compressé """
+        return (b"/Filter /FlateDecode\n/Length %d\n>>\nstream\n"
+                % len(compressed) + compressed + b"\nendstream")
+
+
+def _compressible(stream):
+    # les métadonnées XMP restent lisibles sans décodage
+    return "/Filter" not in stream and stream.get("/Type") != "/Metadata"
+
+
+def deflated(tokens):
+    """ tokens, les Deflate compressés immédiatement """
+    return [Deflate.tail(zlib.compress(token.data))
+            if isinstance(token, Deflate) else token for token in tokens]
+
+
+def tokenize(data, ref_token=lambda ref: ref, compress=False):
+    """
+    Sérialise data en une liste [bytes | référence | Deflate]
+    Les références indirectes sont laissées telles quelles (ou converties par
+    ref_token) pour être numérotées au moment de l'écriture.
+    compress : un flux sans filtre est remplacé par un Deflate (dernier jeton)
+    """
+    tokens = []
+    buf = io.BytesIO()
+
+    def _token(token):
+        tokens.append(buf.getvalue())
+        buf.seek(0)
+        buf.truncate()
+        tokens.append(token)
+
+    def _ref(ref):
+        _token(ref_token(ref))
+
+    def _rec(data):
+        if isinstance(data, IndirectObject):
+            _ref(data)
+        elif isinstance(data, DictionaryObject):
+            is_stream = isinstance(data, StreamObject)
+            buf.write(b"<<\n")
+            for key, value in data.items():
+                if is_stream and key == "/Length":
+                    continue
+                key.writeToStream(buf, None)
+                buf.write(b" ")
+                _rec(value)
+                buf.write(b"\n")
+            # pylint: disable=protected-access
+            if is_stream and compress and _compressible(data):
+                _token(Deflate(data._data))
+            elif is_stream:
+                buf.write(f"/Length {len(data._data)}\n".encode())
+                buf.write(b">>\nstream\n")
+                buf.write(data._data)
+                buf.write(b"\nendstream")
+            else:
+                buf.write(b">>")
+        elif isinstance(data, ArrayObject):
+            buf.write(b"[")
+            for value in data:
+                buf.write(b" ")
+                _rec(value)
+            buf.write(b" ]")
+        else:
+            data.writeToStream(buf, None)
+
+    _rec(data)
+    tokens.append(buf.getvalue())
+    return tokens
+
+
+class _ReaderSource:
+    """ Objets externes lus directement dans les PDF sources """
+
+    def __init__(self, dedup=None, compress=False):
+        self.dedup = dedup
+        self.compress = compress
+
+    def key(self, ref):
+        """ Clé d'identification de l'objet """
+        if self.dedup is not None:
+            return self.dedup.digest(ref)
+        return (id(ref.pdf), ref.generation, ref.idnum)
+
+    def tokens(self, ref):
+        """ Objet sérialisé """
+        return tokenize(ref.getObject(), compress=self.compress)
+
+
+class _FragmentSource:
+    """ Objets externes sérialisés par un FragmentWriter """
+
+    def __init__(self, fragment):
+        self.fragment = fragment
+
+    def key(self, token):
+        """ Clé d'identification de l'objet """
+        return self.fragment.digests.get(token, token)
+
+    def tokens(self, token):
+        """ Objet sérialisé """
+        return self.fragment.externals[token]
+
+
+class StreamingPdfWriter:
+    """
+    Ecriture incrémentale d'un PDF
+    Les objets (et les objets d'un autre PDF qu'ils référencent) sont écrits
+    immédiatement puis oubliés ; seules les positions (xref) sont conservées.
+    L'arbre des pages, le catalogue et l'xref sont écrits par close().
+    dedup (dedup.Deduplicator) : un objet externe n'est écrit qu'une fois par
+    contenu, et non une fois par référence.
+    compress, object_streams : sortie compressée (voir le module)
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, stream, header=b"%PDF-1.3", dedup=None,
+                 compress=False, object_streams=False):
+        # pylint: disable=too-many-arguments
+        self.stream = stream
+        self._source = _ReaderSource(dedup, compress)
+        self.compress = compress
+        self._offsets = {}              # idnum --> position dans le flux
+        self._extern = {}               # clé objet externe --> idnum
+        self._pending = []              # objets externes à recopier
+        self._locals = {}               # références locales d'un fragment
+        self._next_id = 1
+        self._kids = {}                 # index feuille --> ref page
+        self._objstm = [] if object_streams else None   # (idnum, corps)
+        self._in_objstm = {}            # idnum --> (idnum flux d'objets, index)
+        self._deferred = deque()        # (idnum, début, compression en cours)
+        self._pool = ThreadPoolExecutor(os.cpu_count()) \
+            if compress or object_streams else None
+        self.pages_ref = self._reserve()
+        self._root = self._reserve()
+        self._info = self._reserve()
+        if object_streams:
+            header = max(header, b"%PDF-1.5")
+        self.stream.write(header + b"\n")
+
+    def _reserve(self):
+        ref = IndirectObject(self._next_id, 0, self)
+        self._next_id += 1
+        return ref
+
+    def _ref(self, token, source):
+        """ Référence de sortie d'un jeton référence """
+        if isinstance(token, IndirectObject):
+            if token.pdf is self:
+                return token
+        elif token[0] == "out":
+            return IndirectObject(token[1], 0, self)
+        elif token[0] == "local":
+            return self._locals[token[1]]
+        key = source.key(token)
+        if key not in self._extern:
+            ref = self._reserve()
+            self._extern[key] = ref.idnum
+            self._pending.append((ref, token, source))
+        return IndirectObject(self._extern[key], 0, self)
+
+    def _emit(self, idnum, body):
+        self._offsets[idnum] = self.stream.tell()
+        self.stream.write(b"%d 0 obj\n" % idnum)
+        self.stream.write(body)
+        self.stream.write(b"\nendobj\n")
+
+    def _defer(self, idnum, head, data=None):
+        """
+        Ecrit l'objet quand data (fin du flux) sera compressé
+        Les objets suivants attendent leur tour : l'ordre du fichier ne
+        dépend pas de la durée des compressions.
+        """
+        if data is None and not self._deferred:
+            self._emit(idnum, head)
+            return
+        self._deferred.append((idnum, head, None if data is None else
+                               self._pool.submit(zlib.compress, data)))
+        while len(self._deferred) > _MAX_DEFERRED:
+            self._emit_deferred()
+
+    def _emit_deferred(self):
+        idnum, head, compressed = self._deferred.popleft()
+        if compressed is not None:
+            head += Deflate.tail(compressed.result())
+        self._emit(idnum, head)
+
+    def _pack(self):
+        """ Flux d'objets des objets en attente """
+        objects, self._objstm = self._objstm, []
+        ref = self._reserve()
+        header, pos = [], 0
+        for index, (idnum, body) in enumerate(objects):
+            self._in_objstm[idnum] = (ref.idnum, index)
+            header.append(b"%d %d" % (idnum, pos))
+            pos += len(body) + 1
+        header = b" ".join(header) + b"\n"
+        self._defer(ref.idnum,
+                    b"<<\n/Type /ObjStm\n/N %d\n/First %d\n"
+                    % (len(objects), len(header)),
+                    header + b"\n".join(body for _, body in objects))
+
+    def _write(self, ref, tokens, source):
+        parts, deflate = [], None
+        for token in tokens:
+            if isinstance(token, bytes):
+                parts.append(token)
+            elif isinstance(token, Deflate):
+                deflate = token
+            else:
+                parts.append(b"%d 0 R" % self._ref(token, source).idnum)
+        body = b"".join(parts)
+        if deflate is not None:
+            self._defer(ref.idnum, body, deflate.data)
+        elif self._objstm is not None and not body.endswith(b"endstream"):
+            self._objstm.append((ref.idnum, body))
+            if len(self._objstm) >= OBJSTM_SIZE:
+                self._pack()
+        else:
+            self._defer(ref.idnum, body)
+
+    def _flush_pending(self):
+        while self._pending:
+            ref, token, source = self._pending.pop()
+            self._write(ref, source.tokens(token), source)
+
+    def _add_tokens(self, tokens, source):
+        ref = self._reserve()
+        self._write(ref, tokens, source)
+        self._flush_pending()
+        return ref
+
+    def add_object(self, obj):
+        """ Ecrit obj (et ses dépendances) ; retourne sa référence """
+        return self._add_tokens(tokenize(obj, compress=self.compress),
+                                self._source)
+
+    def add_page(self, index, page):
+        """ Ecrit la feuille page à la position index du document """
+        _indirect_contents(self, page)
+        page[NameObject("/Parent")] = self.pages_ref
+        self._kids[index] = self.add_object(page)
+
+    def add_fragment(self, fragment):
+        """ Ecrit un fragment produit par FragmentWriter (autre processus) """
+        source = _FragmentSource(fragment)
+        for kind, index, tokens in fragment.ops:
+            ref = self._add_tokens(tokens, source)
+            if kind == "page":
+                self._kids[index] = ref
+            else:
+                self._locals[index] = ref
+        self._locals.clear()
+
+    def _xref_table(self):
+        xref = self.stream.tell()
+        self.stream.write(f"xref\n0 {self._next_id}\n".encode())
+        self.stream.write(b"0000000000 65535 f \n")
+        for idnum in range(1, self._next_id):
+            self.stream.write(b"%010d 00000 n \n" % self._offsets[idnum])
+        self.stream.write(b"trailer\n")
+        DictionaryObject({
+            NameObject("/Size"): NumberObject(self._next_id),
+            NameObject("/Root"): self._root,
+            NameObject("/Info"): self._info}).writeToStream(self.stream, None)
+        return xref
+
+    def _xref_stream(self):
+        """ xref compressée : type, position ou flux d'objets, index """
+        ref = self._reserve()
+        xref = self._offsets[ref.idnum] = self.stream.tell()
+        width = (max(xref, self._next_id).bit_length() + 7) // 8
+        rows = [b"\0" + bytes(width) + b"\xff\xff"]
+        for idnum in range(1, self._next_id):
+            if idnum in self._in_objstm:
+                objstm, index = self._in_objstm[idnum]
+                rows.append(b"\2" + objstm.to_bytes(width, "big") +
+                            index.to_bytes(2, "big"))
+            else:
+                rows.append(b"\1" + self._offsets[idnum].to_bytes(
+                    width, "big") + b"\0\0")
+        self._emit(ref.idnum, (
+            b"<<\n/Type /XRef\n/Size %d\n/W [ 1 %d 2 ]\n/Root %d 0 R\n"
+            b"/Info %d 0 R\n" % (self._next_id, width, self._root.idnum,
+                                 self._info.idnum)) +
+                   Deflate.tail(zlib.compress(b"".join(rows))))
+        return xref
+
+    def close(self, infos=None):
+        """ Ecrit l'arbre des pages, le catalogue, l'info et l'xref """
+        kids = ArrayObject(self._kids[i] for i in sorted(self._kids))
+        self._write(self.pages_ref, tokenize(DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Count"): NumberObject(len(kids)),
+            NameObject("/Kids"): kids})), None)
+        self._write(self._root, tokenize(DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self.pages_ref})), None)
+        self._write(self._info, tokenize(DictionaryObject({
+            NameObject(key): createStringObject(val)
+            for key, val in (infos or {}).items()})), None)
+
+        if self._objstm:
+            self._pack()
+        while self._deferred:
+            self._emit_deferred()
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._objstm is None:
+            xref = self._xref_table()
+        else:
+            xref = self._xref_stream()
+        self.stream.write(f"\nstartxref\n{xref}\n%%EOF\n".encode())
+        logger.debug(f"\t{self._next_id - 1} objects, {len(kids)} pages, "
+                     f"{len(self._in_objstm)} in object streams")
+
+
+class FragmentWriter:
+    """
+    Même interface que StreamingPdfWriter, mais enregistre les objets
+    sérialisés (et tous les objets externes qu'ils atteignent) pour qu'un
+    StreamingPdfWriter les écrive plus tard avec add_fragment().
+    Le résultat est picklable : ops, externals et digests ne contiennent que
+    des bytes et des tuples (les flux sont compressés ici, avec compress).
+    to_bytes() / from_bytes() : forme sérialisée sans pickle (cache disque).
+    """
+
+    def __init__(self, pages_idnum, dedup=None, compress=False):
+        self.pages_idnum = pages_idnum
+        self.compress = compress
+        self.ops = []                   # (kind, index, tokens)
+        self.externals = {}             # ("ext", gen, idnum) --> tokens
+        self.digests = {}               # ("ext", gen, idnum) --> empreinte
+        self._dedup = dedup
+        self._todo = []
+
+    def _ref_token(self, ref):
+        if ref.pdf is self:
+            return ("local", ref.idnum)
+        if ref.pdf is None:
+            return ("out", ref.idnum)
+        token = ("ext", ref.generation, ref.idnum)
+        if token not in self.externals:
+            self.externals[token] = None
+            self._todo.append((token, ref))
+            if self._dedup is not None:
+                self.digests[token] = self._dedup.digest(ref)
+        return token
+
+    def _tokenize(self, obj):
+        tokens = deflated(tokenize(obj, self._ref_token, self.compress))
+        while self._todo:
+            token, ref = self._todo.pop()
+            self.externals[token] = deflated(tokenize(
+                ref.getObject(), self._ref_token, self.compress))
+        return tokens
+
+    def out_ref(self, idnum):
+        """ Référence vers un objet déjà écrit par le StreamingPdfWriter """
+        return IndirectObject(idnum, 0, None)
+
+    def add_object(self, obj):
+        """ Enregistre obj ; retourne une référence locale """
+        index = len(self.ops)
+        self.ops.append(("object", index, self._tokenize(obj)))
+        return IndirectObject(index, 0, self)
+
+    def add_page(self, index, page):
+        """ Enregistre la feuille page à la position index du document """
+        _indirect_contents(self, page)
+        page[NameObject("/Parent")] = self.out_ref(self.pages_idnum)
+        self.ops.append(("page", index, self._tokenize(page)))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.update(_dedup=None, _todo=[])
+        return state
+
+    def to_bytes(self):
+        """
+        Longueur (4 octets) et en-tête JSON (structure, longueur des bytes),
+        suivis des bytes des objets dans l'ordre de l'en-tête
+        """
+        blobs = []
+
+        def _tokens(tokens):
+            out = []
+            for token in tokens:
+                if isinstance(token, bytes):
+                    blobs.append(token)
+                    out.append(len(token))
+                else:
+                    out.append(list(token))
+            return out
+
+        header = json.dumps({
+            "pages_idnum": self.pages_idnum, "compress": self.compress,
+            "ops": [[kind, index, _tokens(tokens)]
+                    for kind, index, tokens in self.ops],
+            "externals": [[list(token), _tokens(tokens)]
+                          for token, tokens in self.externals.items()],
+            "digests": [[list(token), digest.hex() if isinstance(
+                digest, bytes) else list(digest)]
+                        for token, digest in self.digests.items()],
+        }).encode()
+        return b"".join([struct.pack(">I", len(header)), header] + blobs)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """ Fragment de to_bytes() ; ValueError si data est invalide """
+        view = memoryview(data)
+        try:
+            pos = 4 + struct.unpack(">I", view[:4])[0]
+            header = json.loads(bytes(view[4:pos]))
+
+            def _ref(token):
+                if _REF_KINDS.get(token[0]) != len(token) or \
+                        not all(isinstance(val, int) for val in token[1:]):
+                    raise ValueError(f"bad reference {token}")
+                return tuple(token)
+
+            def _tokens(tokens):
+                nonlocal pos
+                out = []
+                for token in tokens:
+                    if isinstance(token, int):
+                        if not 0 <= token <= len(view) - pos:
+                            raise ValueError("truncated fragment")
+                        out.append(bytes(view[pos:pos + token]))
+                        pos += token
+                    else:
+                        out.append(_ref(token))
+                return out
+
+            fragment = cls(int(header["pages_idnum"]),
+                           compress=bool(header["compress"]))
+            for kind, index, tokens in header["ops"]:
+                if kind not in ("object", "page"):
+                    raise ValueError(f"bad operation {kind}")
+                fragment.ops.append((kind, int(index), _tokens(tokens)))
+            for token, tokens in header["externals"]:
+                fragment.externals[_ref(token)] = _tokens(tokens)
+            for token, digest in header["digests"]:
+                fragment.digests[_ref(token)] = bytes.fromhex(digest) \
+                    if isinstance(digest, str) else tuple(digest)
+        except (KeyError, TypeError, IndexError, struct.error) as ex:
+            raise ValueError(f"bad fragment: {ex}") from ex
+        if pos != len(view):
+            raise ValueError("trailing data in fragment")
+        return fragment
@@ -47,5 +47,7 @@ setuptools.setup(
         "Topic :: Software Development :: Libraries :: Python Modules"
     ],
     install_requires=required,
+    # bin/bench.py génère ses entrées avec fpdf
+    extras_require={"bench": ["fpdf"], "test": ["pytest"]},
     python_requires='>=3.6',
 )
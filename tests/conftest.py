@@ -0,0 +1,50 @@
+"""
+Fixtures : small PDF files generated with PyPDF2
+"""
+
+import io
+import os
+import sys
+
+import pytest
+import PyPDF2
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+A5 = (420.9, 595.3)
+
+
+def make_pdf(nb_pages, size=A5, fonts=1):
+    """
+    PDF of nb_pages pages of the given size, each one writing its number
+    The pages use fonts identical Helvetica font objects in turn.
+    """
+    # pylint: disable=protected-access
+    out = PyPDF2.PdfFileWriter()
+    font_refs = [out._addObject(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica")}))
+                 for _ in range(fonts)]
+    for index in range(nb_pages):
+        page = out.addBlankPage(*size)
+        content = DecodedStreamObject()
+        content.setData(f"BT /F1 24 Tf 50 50 Td (page {index}) Tj ET".encode())
+        page[NameObject("/Contents")] = out._addObject(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({
+                NameObject("/F1"): font_refs[index % fonts]})})
+    data = io.BytesIO()
+    out.write(data)
+    return data.getvalue()
+
+
+@pytest.fixture(name="pdf_file")
+def fixture_pdf_file(tmp_path):
+    """ make_pdf() written in tmp_path ; returns its file name """
+    def _pdf_file(nb_pages, name="in.pdf", **options):
+        path = tmp_path / name
+        path.write_bytes(make_pdf(nb_pages, **options))
+        return str(path)
+    return _pdf_file
@@ -0,0 +1,87 @@
+"""
+Fold tables and placement plan
+"""
+
+import numpy
+import pytest
+
+from hackimposition.fold import default_folds, fold_table
+from hackimposition.imposition import (PLAN_DTYPE, ImposerAlgo,
+                                       ImposerPageTemplate, compute_plan)
+
+GRIDS = [(1, 1), (2, 1), (1, 2), (2, 2), (3, 1), (3, 2), (4, 2), (2, 4)]
+POWER_OF_TWO_GRIDS = [(1, 1), (2, 1), (1, 2), (2, 2), (4, 2), (2, 4), (4, 4)]
+
+
+def _slots(table):
+    return sorted(tuple(row[:3]) for row in table.tolist())
+
+
+def _all_slots(nb_w, nb_h):
+    return sorted((side, x, y) for side in (0, 1)
+                  for x in range(2 * nb_w) for y in range(nb_h))
+
+
+@pytest.mark.parametrize("nb_w, nb_h", GRIDS)
+def test_natural_table_is_a_permutation(nb_w, nb_h):
+    table = fold_table(nb_w, nb_h)
+    assert table.shape == (4 * nb_w * nb_h, 4)
+    assert _slots(table) == _all_slots(nb_w, nb_h)
+    assert set(table[:, 3].tolist()) <= {0, 1}
+
+
+@pytest.mark.parametrize("nb_w, nb_h", POWER_OF_TWO_GRIDS)
+def test_fold_table_is_a_permutation(nb_w, nb_h):
+    table = fold_table(nb_w, nb_h, "fold")
+    assert table.shape == (4 * nb_w * nb_h, 4)
+    assert _slots(table) == _all_slots(nb_w, nb_h)
+    assert set(table[:, 3].tolist()) <= {0, 1}
+
+
+@pytest.mark.parametrize("folds", ["<v", "v<", ">^", "^>"])
+def test_fold_sequences_are_permutations(folds):
+    assert _slots(fold_table(1, 2, folds)) == _all_slots(1, 2)
+
+
+@pytest.mark.parametrize("nb_w, nb_h", POWER_OF_TWO_GRIDS)
+def test_default_folds_fold_down_to_one_cell(nb_w, nb_h):
+    folds = default_folds(nb_w, nb_h)
+    assert 2 ** len(folds) == 2 * nb_w * nb_h
+    assert set(folds) <= set("<>v")
+
+
+@pytest.mark.parametrize("nb_w, nb_h, folds", [
+    (3, 1, "fold"),         # 6 colonnes
+    (2, 2, "<<"),           # reste une feuille 1x2
+    (2, 2, "<<<v"),         # plie une seule colonne
+    (1, 1, "x"),            # pli inconnu
+])
+def test_invalid_folds(nb_w, nb_h, folds):
+    with pytest.raises(ValueError):
+        fold_table(nb_w, nb_h, folds)
+
+
+def test_fold_table_is_read_only():
+    table = fold_table(2, 2)
+    assert table is fold_table(2, 2)
+    with pytest.raises(ValueError):
+        table[0, 0] = 1
+
+
+@pytest.mark.parametrize("method", [None, "natural", "fold"])
+@pytest.mark.parametrize("nb_pages", [1, 16, 17, 33])
+def test_plan_places_every_page_once(method, nb_pages):
+    template = ImposerPageTemplate()
+    imposer = ImposerAlgo(template.nb_w, template.nb_h, method)
+    template.compute_internals(420.9, 595.3, warn=False)
+    imposer.compute_internals(nb_pages)
+    plan = compute_plan(imposer, template)
+    assert plan.dtype == PLAN_DTYPE
+    assert not plan.flags.writeable
+    assert plan["index"].tolist() == list(range(nb_pages))
+    positions = set(zip(plan["sheet"].tolist(), plan["x"].tolist(),
+                        plan["y"].tolist()))
+    assert len(positions) == nb_pages
+    assert plan["sheet"].max() < imposer.nb_out_pages
+    assert imposer.nb_out_pages == -(-nb_pages // 16) * 2
+    assert numpy.isfinite(plan["matrix"]).all()
@@ -0,0 +1,111 @@
+"""
+impose() in every mode, deduplication, quote() and the layout optimizer
+"""
+
+import io
+import json
+
+import pytest
+import PyPDF2
+
+import hackimposition
+from hackimposition.layout import LayoutOptimizer, apply
+from hackimposition.verify import verify
+from conftest import A5, make_pdf
+
+
+def _impose(infile, outfile=None, **options):
+    template = hackimposition.ImposerPageTemplate()
+    imposer = hackimposition.ImposerAlgo(template.nb_w, template.nb_h)
+    return hackimposition.impose(template, imposer, infile, outfile,
+                                 **options)
+
+
+def _sides(nb_pages):
+    return -(-nb_pages // 16) * 2
+
+
+@pytest.mark.parametrize("nb_pages", [1, 17, 33])
+def test_impose_modes_write_the_same_file(nb_pages):
+    data = make_pdf(nb_pages)
+    reference = _impose(data, stream=True)
+    verify(reference, "full", _sides(nb_pages), 1190.7, 842.0)
+    for options in ({"jobs": 2}, {"pipeline": True}):
+        assert _impose(data, **options) == reference
+    serial = _impose(data)
+    verify(serial, "full", _sides(nb_pages), 1190.7, 842.0)
+
+
+@pytest.mark.parametrize("options", [{}, {"stream": True}])
+def test_impose_places_every_page(options):
+    output = _impose(make_pdf(17), **options)
+    pdf = PyPDF2.PdfFileReader(io.BytesIO(output))
+    placed = b"".join(
+        form.getObject().getData()
+        for index in range(pdf.getNumPages())
+        for form in pdf.getPage(index)["/Resources"]["/XObject"].values())
+    for index in range(17):
+        assert f"(page {index})".encode() in placed
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_dedup_writes_identical_objects_once(stream):
+    data = make_pdf(8, fonts=4)
+    deduplicated = _impose(data, stream=stream)
+    assert deduplicated.count(b"/Helvetica") == 1
+    assert _impose(data, stream=stream, dedup=False).count(b"/Helvetica") == 4
+
+
+def test_incremental_reuses_sheets(tmp_path):
+    data = make_pdf(33)
+    cache = hackimposition.SheetCache(str(tmp_path / "cache"))
+    first = _impose(data, sheet_cache=cache)
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+    assert _impose(data, sheet_cache=cache) == first
+    assert _impose(data, stream=True) == first
+
+
+def test_chunk_writes_parts_and_manifest(pdf_file, tmp_path):
+    outfile = str(tmp_path / "out.pdf")
+    _impose(pdf_file(33), outfile, chunk=2)
+    files, manifest_file = hackimposition.chunk_files(outfile, 2)
+    with open(manifest_file) as file:
+        manifest = json.load(file)
+    assert manifest["complete"]
+    assert [chunk["nb_pages"] for chunk in manifest["chunks"]] == [4, 2]
+    for filename, chunk in zip(files, manifest["chunks"]):
+        verify(filename, "full", chunk["nb_pages"], 1190.7, 842.0)
+
+
+def test_quote_matches_imposition():
+    data = make_pdf(17)
+    template = hackimposition.ImposerPageTemplate()
+    imposer = hackimposition.ImposerAlgo(template.nb_w, template.nb_h)
+    result = hackimposition.quote(template, imposer, data)
+    assert (result["nb_in_pages"], result["nb_out_pages"]) == (17, 4)
+    assert result["blank_pages"] == 4 * 8 - 17
+    assert len(result["sides"]) == 17
+    assert set(result["sides"]) <= set(range(4))
+    assert result["page_width"] == pytest.approx(A5[0])
+    assert 0 < result["paper_used"] < 1
+    assert result["paper_used"] + result["paper_waste"] == pytest.approx(1)
+    json.dumps(result)
+
+
+def test_layout_optimizer_ranks_layouts():
+    template = hackimposition.ImposerPageTemplate()
+    optimizer = LayoutOptimizer(template, max_w=4, max_h=4, steps=1)
+    layouts = optimizer.best(*A5, 100, top=5, max_scale=None)
+    scales = [layout["scale"] for layout in layouts]
+    assert len(layouts) == 5 and scales == sorted(scales, reverse=True)
+
+    cheapest = optimizer.best(*A5, 100, "impressions", min_scale=0.5)[0]
+    assert cheapest["scale"] >= 0.5
+    assert all(layout["impressions"] >= cheapest["impressions"]
+               for layout in optimizer.best(*A5, 100, "impressions",
+                                            min_scale=0.5, top=50))
+    apply(cheapest, template)
+    assert (template.nb_w, template.nb_h) == (cheapest["nb_w"],
+                                              cheapest["nb_h"])
+    with pytest.raises(ValueError):
+        optimizer.best(*A5, 100, "cost")
@@ -0,0 +1,71 @@
+"""
+serve : options accepted in the query string
+"""
+
+import io
+
+import pytest
+
+from hackimposition.options import process_args
+from hackimposition.server import (ImpositionService, _check_options,
+                                   _query_argv)
+
+
+def test_query_argv():
+    assert _query_argv("nb_w=2&stream&method=fold") == \
+        ["--nb_w=2", "--stream", "--method=fold"]
+    # valeur collée : jamais lue comme une autre option
+    assert _query_argv("nb_w=--outfile=/tmp/x") == ["--nb_w=--outfile=/tmp/x"]
+
+
+@pytest.mark.parametrize("query", [
+    "outfile=/tmp/x", "export_plan=/tmp/x", "profile=/tmp/x",
+    "cache_dir=/tmp/x", "incremental", "chunk=1", "variant=a:--nb_w=1",
+    "plan_only", "jobs=64", "nb_w=2&export_pla=/tmp/x",
+])
+def test_query_argv_rejects_options(query):
+    with pytest.raises(ValueError):
+        _query_argv(query)
+
+
+def test_check_options():
+    argv = ["in.pdf", "--outfile", "out.pdf"]
+    _check_options("in.pdf", "out.pdf", process_args(argv + ["--nb_w=1"],
+                                                     verbosity=False))
+    for extra in (["--export_plan=plan.json"], ["--profile=p.json"],
+                  ["--chunk=1"], ["--plan_only"]):
+        with pytest.raises(ValueError):
+            _check_options("in.pdf", "out.pdf",
+                           process_args(argv + extra, verbosity=False))
+    with pytest.raises(ValueError):
+        _check_options("in.pdf", "other.pdf",
+                       process_args(argv, verbosity=False))
+
+
+@pytest.fixture(name="service")
+def fixture_service():
+    service = ImpositionService(workers=1, queue=0)
+    yield service
+    service.close()
+
+
+@pytest.mark.parametrize("query", [
+    "outfile=/tmp/x", "nb_w=--outfile=/tmp/x", "stream=--export_plan=/tmp/x",
+    "nb_w=two", "verify=sometimes",
+])
+def test_service_rejects_options(service, query):
+    with pytest.raises(ValueError):
+        service.impose(1, query, io.BytesIO(), 0)
+
+
+def test_service_rejects_invalid_pdf(service):
+    body = b"%PDF-1.3\nnot a PDF\n"
+    with pytest.raises(ValueError, match="invalid input PDF"):
+        service.impose(1, "", io.BytesIO(body), len(body))
+
+
+def test_service_admits_workers_plus_queue(service):
+    assert service.admit()
+    assert not service.admit()
+    service.release(0., "invalid")
+    assert service.metrics()["invalid"] == 1
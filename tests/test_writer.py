@@ -0,0 +1,120 @@
+"""
+Streaming writer, fragments, sheet cache and verification
+"""
+
+import io
+
+import pytest
+import PyPDF2
+
+from hackimposition.imposition import SheetCache
+from hackimposition.verify import VerifyError, verify, verify_fast
+from hackimposition.writer import FragmentWriter, StreamingPdfWriter
+from conftest import A5, make_pdf
+
+
+def _copy(data, **options):
+    """ Pages of data written again by a StreamingPdfWriter """
+    pdf = PyPDF2.PdfFileReader(io.BytesIO(data))
+    out = io.BytesIO()
+    writer = StreamingPdfWriter(out, **options)
+    for index in range(pdf.getNumPages()):
+        writer.add_page(index, pdf.getPage(index))
+    writer.close({"/Title": "copy"})
+    return out.getvalue()
+
+
+def _text(data):
+    pdf = PyPDF2.PdfFileReader(io.BytesIO(data))
+    return [pdf.getPage(index).getContents().getData()
+            for index in range(pdf.getNumPages())]
+
+
+@pytest.mark.parametrize("options", [
+    {}, {"compress": True}, {"object_streams": True},
+    {"compress": True, "object_streams": True},
+])
+def test_writer_verify_round_trip(options):
+    data = make_pdf(5)
+    copy = _copy(data, **options)
+    for level in ("fast", "full"):
+        verify(copy, level, 5, *A5)
+    assert _text(copy) == _text(data)
+    assert PyPDF2.PdfFileReader(io.BytesIO(copy)).getDocumentInfo()[
+        "/Title"] == "copy"
+
+
+def test_verify_rejects_page_count_and_size():
+    copy = _copy(make_pdf(3))
+    with pytest.raises(VerifyError):
+        verify_fast(copy, 4, *A5)
+    with pytest.raises(VerifyError):
+        verify_fast(copy, 3, 595.3, 841.9)
+
+
+@pytest.mark.parametrize("object_streams", [False, True])
+def test_verify_rejects_truncated_file(object_streams):
+    copy = _copy(make_pdf(3), object_streams=object_streams)
+    with pytest.raises(VerifyError):
+        verify_fast(copy[:len(copy) // 2], 3, *A5)
+
+
+def _fragment(data, pages_idnum, compress=False):
+    pdf = PyPDF2.PdfFileReader(io.BytesIO(data))
+    fragment = FragmentWriter(pages_idnum, compress=compress)
+    for index in range(pdf.getNumPages()):
+        fragment.add_page(index, pdf.getPage(index))
+    return fragment
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_fragment_bytes_round_trip(compress):
+    data = make_pdf(4)
+    outputs = []
+    for serialize in (False, True):
+        out = io.BytesIO()
+        writer = StreamingPdfWriter(out, compress=compress)
+        fragment = _fragment(data, writer.pages_ref.idnum, compress)
+        if serialize:
+            fragment = FragmentWriter.from_bytes(fragment.to_bytes())
+        writer.add_fragment(fragment)
+        writer.close()
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1]
+    verify(outputs[1], "full", 4, *A5)
+
+
+@pytest.mark.parametrize("data", [b"", b"\x00\x00\x00\x10{}",
+                                  b"\x00\x00\x00\x02{}" + b"x" * 8])
+def test_fragment_from_bytes_rejects_invalid_data(data):
+    with pytest.raises(ValueError):
+        FragmentWriter.from_bytes(data)
+
+
+def test_sheet_cache_round_trip(tmp_path):
+    cache = SheetCache(str(tmp_path))
+    fragment = _fragment(make_pdf(2), 1)
+    assert cache.get("abc") is None
+    cache.put("abc", fragment)
+    assert cache.get("abc").to_bytes() == fragment.to_bytes()
+
+    # une entrée corrompue est ignorée
+    path = tmp_path / "sheet-abc.frag"
+    path.write_bytes(path.read_bytes()[:-1] + b"?")
+    assert cache.get("abc") is None
+    # et une entrée copiée sous une autre clé aussi
+    cache.put("abc", fragment)
+    (tmp_path / "sheet-def.frag").write_bytes(path.read_bytes())
+    assert cache.get("def") is None
+
+
+def test_sheet_cache_evicts_least_recently_used(tmp_path):
+    fragment = _fragment(make_pdf(2), 1)
+    size = len(fragment.to_bytes())
+    cache = SheetCache(str(tmp_path), max_bytes=int(2.5 * size))
+    for key in ("a", "b", "c"):
+        cache.put(key, fragment)
+    cache.get("a")
+    cache.evict()
+    assert cache.get("a") is not None
+    assert len(list(tmp_path.iterdir())) == 2